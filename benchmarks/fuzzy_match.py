@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+'''
+Measures the time to match a typed prefix against a corpus of generated paths
+with `fuzzy_path_validator` and with `FuzzyMatcher`, as done on every TAB press
+of an argument with a large completer.
+'''
+
+import random
+import statistics
+import time
+
+from hashbang import command, Argument
+from hashbang.completion import (
+    FuzzyIndex, FuzzyMatcher, fuzzy_path_validator)
+
+WORDS = [
+    'src', 'lib', 'test', 'tests', 'docs', 'build', 'core', 'util', 'utils',
+    'api', 'client', 'server', 'model', 'models', 'view', 'views', 'config',
+    'common', 'internal', 'plugin', 'plugins', 'parser', 'completion',
+    'hashbang', 'argument', 'command', 'delegate', 'extension', 'cache',
+]
+EXTENSIONS = ['.py', '.txt', '.md', '.json', '.cfg']
+QUERIES = ['src/co', 'te/arg/com', 'hbcomp', 'plgcache', 'xyzzy']
+
+
+def generate_paths(count, seed=0):
+    rng = random.Random(seed)
+    paths = set()
+    while len(paths) < count:
+        segments = [rng.choice(WORDS) for _ in range(rng.randint(1, 5))]
+        name = '{}_{}{}'.format(
+            rng.choice(WORDS), rng.randint(0, 999), rng.choice(EXTENSIONS))
+        paths.add('/'.join(segments + [name]))
+    return sorted(paths)
+
+
+def median_time(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+@command(
+    Argument('paths', type=int, help='Number of paths in the corpus'),
+    Argument('runs', type=int, help='Number of runs to time for each query'),
+    Argument('limit', type=int, help='Number of ranked results to keep'))
+def main(*, paths=100000, runs=5, limit=50):
+    corpus = generate_paths(paths)
+    matcher = FuzzyMatcher(limit=limit, sep='/')
+    start = time.perf_counter()
+    index = FuzzyIndex(corpus)
+    print('Built index of {} paths in {:.1f} ms'.format(
+        len(corpus), (time.perf_counter() - start) * 1000))
+
+    variants = (
+        ('fuzzy_path_validator', lambda query: [
+            path for path in corpus if fuzzy_path_validator(path, query)]),
+        ('FuzzyMatcher filter', lambda query: [
+            path for path in corpus if matcher(path, query)]),
+        ('FuzzyMatcher.rank', lambda query: matcher.rank(corpus, query)),
+        ('FuzzyMatcher.rank (index)',
+         lambda query: matcher.rank(index, query)),
+    )
+    for query in QUERIES:
+        print('{!r}: {} ranked matches, best {}'.format(
+            query, len(matcher.rank(index, query)),
+            matcher.rank(index, query)[:1]))
+        for name, func in variants:
+            elapsed = median_time(lambda: func(query), runs)
+            print('  {:>26}: {:8.1f} ms'.format(name, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main.execute()
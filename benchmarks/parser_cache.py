@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+'''
+Measures the cold-run saving of `@command(parser_cache=...)`, by running a
+generated script with many arguments in a fresh interpreter, with and without
+the parser cache.
+'''
+
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from hashbang import command, Argument
+from pathlib import Path
+
+DIR = Path(__file__).resolve().parent
+
+SCRIPT_TEMPLATE = '''
+from hashbang import command, Argument
+
+@command(
+    {arguments}
+    parser_cache={cache})
+def main(src, dest=None, *rest, {params}):
+    """
+    Generated benchmark command.
+    """
+
+if __name__ == '__main__':
+    main.execute()
+'''
+
+
+def generate_script(path, num_flags, cache):
+    arguments = ''.join(
+        "Argument('flag{0}', help='Help for flag {0}', aliases=('f{0}',)),\n"
+        "    ".format(i) for i in range(num_flags))
+    params = ', '.join(
+        'flag{}={}'.format(i, 'False' if i % 2 else "'value'")
+        for i in range(num_flags))
+    path.write_text(SCRIPT_TEMPLATE.format(
+        arguments=arguments, params=params, cache=cache))
+
+
+def time_run(script):
+    env = {'PYTHONPATH': str(DIR.parent)}
+    start = time.perf_counter()
+    subprocess.check_call([sys.executable, str(script), 'src'], env=env)
+    return time.perf_counter() - start
+
+
+@command(
+    Argument('flags', type=int,
+             help='Number of flags in the generated command'),
+    Argument('runs', type=int,
+             help='Number of cold runs to time for each variant'))
+def main(*, flags=50, runs=30):
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        uncached = tmp/'uncached.py'
+        cached = tmp/'cached.py'
+        generate_script(uncached, flags, 'None')
+        generate_script(cached, flags, repr(str(tmp/'cache')))
+        # Populate the cache
+        time_run(cached)
+
+        # Interleave the runs so that both variants see the same system load
+        variants = (('no cache', uncached), ('cache', cached))
+        timings = {name: [] for name, _ in variants}
+        for _ in range(runs):
+            for name, script in variants:
+                timings[name].append(time_run(script))
+        results = {}
+        for name, _ in variants:
+            results[name] = statistics.median(timings[name])
+            print('{:>10}: median {:.2f} ms over {} runs'.format(
+                name, results[name] * 1000, runs))
+        saving = results['no cache'] - results['cache']
+        print('{:>10}: {:.2f} ms ({:.1%})'.format(
+            'saving', saving * 1000, saving / results['no cache']))
+
+
+if __name__ == '__main__':
+    main.execute()
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+
+'''
+Measures the latency of hashbang commands: cold start of a script, warm
+`execute` in an already running interpreter, the cost of building the parser
+and parsing as the number of flags, positional arguments and the length of
+argv grow, delegation through `subcommands` trees of increasing depth, and TAB
+completion (using `_ARGCOMPLETE` and `COMP_LINE`, like `tests/hashbang_test.py`).
+
+```sh
+$ cp benchmarks/run.py /tmp/run.py
+$ git checkout main
+$ PYTHONPATH=. /tmp/run.py run --output before.json
+$ git checkout my-branch
+$ PYTHONPATH=. /tmp/run.py run --output after.json
+$ PYTHONPATH=. /tmp/run.py compare before.json after.json
+```
+
+The benchmarks use the hashbang package found on `PYTHONPATH`, so this script
+also runs against revisions older than itself. Benchmarks of features which
+the revision does not have are skipped.
+
+`compare` exits with status 1 if any benchmark got slower by more than the
+threshold.
+'''
+
+import hashbang
+import inspect
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from hashbang import command, subcommands, Argument
+from pathlib import Path
+
+DIR = Path(__file__).resolve().parent
+# The directory containing the hashbang package being measured
+HASHBANG_PATH = Path(hashbang.__file__).resolve().parent.parent
+
+
+class Unsupported(Exception):
+    '''
+    Raised when a benchmark needs a feature that the measured revision of
+    hashbang does not have.
+    '''
+
+
+def require_argument_option(name):
+    if name not in inspect.signature(Argument).parameters:
+        raise Unsupported('Argument({}=...) is not available'.format(name))
+
+SCRIPT_TEMPLATE = '''
+from hashbang import command, subcommands, Argument
+
+{definitions}
+
+if __name__ == '__main__':
+    main.execute()
+'''
+
+
+def flags_source(num_flags):
+    params = ', '.join(
+        'flag{}={}'.format(i, 'False' if i % 2 else "'value'")
+        for i in range(num_flags))
+    return (
+        '@command\n'
+        'def main(src, *, {}):\n'
+        '    pass\n'.format(params))
+
+
+def positionals_source(num_positionals):
+    params = ', '.join('pos{}'.format(i) for i in range(num_positionals))
+    return (
+        '@command\n'
+        'def main({}):\n'
+        '    pass\n'.format(params))
+
+
+def var_positional_source():
+    return (
+        '@command\n'
+        'def main(*items, verbose=False):\n'
+        '    pass\n')
+
+
+def annotated_paths_source():
+    return (
+        'from pathlib import Path\n'
+        '@command\n'
+        'def main(*paths: Path):\n'
+        '    pass\n')
+
+
+def numbers_source(container):
+    if container:
+        return (
+            '@command\n'
+            "def main(values: Argument(type=float, container='array')):\n"
+            '    pass\n')
+    return (
+        '@command\n'
+        'def main(*values: Argument(type=float)):\n'
+        '    pass\n')
+
+
+def tree_source(depth):
+    '''
+    A tree of `subcommands` of the given depth, where each level has ten
+    subcommands, the first of which delegates to the next level.
+    '''
+    lines = [
+        '@command',
+        'def leaf(arg, *, flag=False):',
+        '    pass',
+        '',
+        'node = leaf',
+    ]
+    for _ in range(depth):
+        lines.append(
+            "node = subcommands(('sub0', node), "
+            "*[('sub{}'.format(i), leaf) for i in range(1, 10)])")
+    lines.append('main = node')
+    return '\n'.join(lines) + '\n'
+
+
+def tree_argv(depth):
+    return ['sub0'] * depth + ['x']
+
+
+def new_namespace():
+    return {
+        '__name__': 'benchmark',
+        'command': command,
+        'subcommands': subcommands,
+        'Argument': Argument,
+    }
+
+
+def load_command(source):
+    '''
+    Defines the command in `source` in a new namespace, returning the `main`
+    function.
+    '''
+    namespace = new_namespace()
+    exec(compile(source, '<benchmark>', 'exec'), namespace)
+    return namespace['main']
+
+
+def time_in_process(func, runs, loops):
+    '''
+    Returns the timings of `runs` runs of calling `func` `loops` times, in
+    milliseconds per call.
+    '''
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        timings.append((time.perf_counter() - start) * 1000 / loops)
+    return timings
+
+
+def time_subprocess(script, args, runs, env=None):
+    full_env = {'PYTHONPATH': str(HASHBANG_PATH)}
+    full_env.update(env or {})
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, str(script)] + args,
+            cwd=str(script.parent),
+            env=full_env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=False)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def time_completion(script, comp_line, runs):
+    return time_subprocess(script, [], runs, env={
+        '_ARGCOMPLETE': '1',
+        '_COMPLETE_TO_STDOUT': '1',
+        'COMP_LINE': comp_line,
+        'COMP_POINT': str(len(comp_line)),
+    })
+
+
+def execute_once(main, argv):
+    '''
+    Executes `main` with `argv` in this process, and returns the exit code.
+    Revisions without `execute_many` are executed with `execute`, catching the
+    `SystemExit` it raises.
+    '''
+    execute_many = getattr(main, 'execute_many', None)
+    if execute_many is not None:
+        for _, code in execute_many([argv]):
+            return code
+    try:
+        main.execute(argv)
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else 1
+    return 0
+
+
+def warm_execute(main, argv):
+    '''
+    Returns a function which executes `main` with `argv` in this process,
+    after a first execution which builds the parser.
+    '''
+    def execute():
+        code = execute_once(main, argv)
+        if code != 0:
+            raise RuntimeError(
+                'Benchmark command {} exited with {}'.format(argv, code))
+    execute()
+    return execute
+
+
+def build_and_execute(source, argv):
+    '''
+    Returns a function which defines the command in `source` and executes it
+    with `argv`, including building its parser.
+    '''
+    code = compile(source, '<benchmark>', 'exec')
+
+    def execute():
+        namespace = new_namespace()
+        exec(code, namespace)
+        execute_once(namespace['main'], argv)
+    return execute
+
+
+def benchmarks(tmp, quick):
+    '''
+    Yields `(name, run)` for each benchmark, where `run(runs)` returns the
+    list of timings in milliseconds. The commands are only defined when the
+    benchmark is run.
+    '''
+    sizes = (10, 100) if quick else (10, 100, 500)
+    loops = 20 if quick else 100
+    build_loops = 5 if quick else 20
+
+    def script(name, source):
+        path = tmp/'{}.py'.format(name)
+        if not path.exists():
+            path.write_text(SCRIPT_TEMPLATE.format(definitions=source))
+        return path
+
+    def cold(path, argv):
+        return lambda runs: time_subprocess(path, argv, runs)
+
+    def build(source, argv):
+        return lambda runs: time_in_process(
+            build_and_execute(source, argv), runs, build_loops)
+
+    def warm(source, argv, loops=loops, requires=()):
+        def run(runs):
+            for option in requires:
+                require_argument_option(option)
+            return time_in_process(
+                warm_execute(load_command(source), argv), runs, loops)
+        return run
+
+    def complete(path, comp_line):
+        return lambda runs: time_completion(path, comp_line, runs)
+
+    (tmp/'python_only.py').write_text('')
+    yield 'cold_start/python', cold(tmp/'python_only.py', [])
+    yield 'cold_start/hashbang', cold(
+        script('empty', '@command\ndef main():\n    pass\n'), [])
+
+    for num_flags in sizes:
+        source = flags_source(num_flags)
+        argv = ['src', '--flag0', 'x', '--flag1']
+        yield ('cold_start/flags_{}'.format(num_flags),
+               cold(script('flags_{}'.format(num_flags), source), argv))
+        yield 'build/flags_{}'.format(num_flags), build(source, argv)
+        yield 'parse/flags_{}'.format(num_flags), warm(source, argv)
+
+    for num_positionals in sizes:
+        source = positionals_source(num_positionals)
+        argv = [str(i) for i in range(num_positionals)]
+        yield 'build/positionals_{}'.format(num_positionals), build(
+            source, argv)
+        yield 'parse/positionals_{}'.format(num_positionals), warm(
+            source, argv)
+
+    for length in (10, 1000) if quick else (10, 1000, 10000):
+        argv = [str(i) for i in range(length)] + ['--verbose']
+        yield 'parse/argv_{}'.format(length), warm(
+            var_positional_source(), argv, max(1, loops * 10 // length))
+
+    for length in (1000,) if quick else (1000, 10000):
+        # Many repeated values, like the output of find piped to xargs
+        argv = ['dir{}/file'.format(i % 100) for i in range(length)]
+        yield 'parse/annotated_paths_{}'.format(length), warm(
+            annotated_paths_source(), argv, max(1, loops * 10 // length))
+
+    for length in (1000,) if quick else (1000, 100000):
+        argv = [str(i / 8) for i in range(length)]
+        for name, container in (('floats', False), ('float_array', True)):
+            yield 'parse/{}_{}'.format(name, length), warm(
+                numbers_source(container), argv,
+                max(1, loops * 10 // length),
+                requires=('container',) if container else ())
+
+    for depth in (1, 4) if quick else (1, 4, 8):
+        source = tree_source(depth)
+        argv = tree_argv(depth)
+        tree = script('tree_{}'.format(depth), source)
+        yield 'cold_start/delegation_{}'.format(depth), cold(tree, argv)
+        yield 'execute/delegation_{}'.format(depth), warm(source, argv)
+        yield 'complete/delegation_{}'.format(depth), complete(
+            tree, ' '.join([tree.name] + argv[:depth - 1] + ['sub']))
+
+    flags = script('flags_100', flags_source(100))
+    yield 'complete/flags_100', complete(
+        flags, '{} src --flag9'.format(flags.name))
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=str(DIR),
+            stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@command
+def run(*only,
+        output: Argument(help='Path of the JSON file to write') = None,
+        runs: Argument(type=int, help='Number of runs of each benchmark') = 10,
+        quick: Argument(help='Run fewer and smaller benchmarks') = False):
+    '''
+    Runs the benchmarks whose names start with any of `only` (or all of them),
+    printing the median time of each and writing them to `output`.
+    '''
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, benchmark in benchmarks(Path(tmp), quick):
+            if only and not name.startswith(only):
+                continue
+            try:
+                timings = benchmark(runs)
+            except Unsupported as e:
+                print('{:<32} skipped: {}'.format(name, e))
+                continue
+            results[name] = {
+                'median_ms': statistics.median(timings),
+                'min_ms': min(timings),
+                'runs': len(timings),
+            }
+            print('{:<32} {:10.3f} ms'.format(name, results[name]['median_ms']))
+            sys.stdout.flush()
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'revision': git_revision(),
+                    'python': sys.version,
+                    'platform': platform.platform(),
+                    'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                },
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+
+@command
+def compare(
+        base,
+        head,
+        *,
+        threshold: Argument(
+            type=float,
+            help='Relative slowdown at which a benchmark is a regression') = 0.1,
+        min_difference: Argument(
+            type=float,
+            help='Slowdowns of fewer milliseconds than this are ignored') = 0.05):
+    '''
+    Compares two result files written by `run --output`, and exits with status
+    1 if any benchmark in `head` is slower than in `base` by more than
+    `threshold`.
+    '''
+    with open(base) as f:
+        base_results = json.load(f)['results']
+    with open(head) as f:
+        head_results = json.load(f)['results']
+    regressions = []
+    print('{:<32} {:>10} {:>10} {:>8}'.format('benchmark', 'base', 'head',
+                                              'change'))
+    for name in sorted(set(base_results) & set(head_results)):
+        before = base_results[name]['median_ms']
+        after = head_results[name]['median_ms']
+        change = after / before - 1 if before else 0
+        regressed = (change > threshold and
+                     after - before > min_difference)
+        if regressed:
+            regressions.append(name)
+        print('{:<32} {:10.3f} {:10.3f} {:+7.1%}{}'.format(
+            name, before, after, change, '  REGRESSION' if regressed else ''))
+    for name in sorted(set(base_results) ^ set(head_results)):
+        print('{:<32} only in {}'.format(
+            name, 'base' if name in base_results else 'head'))
+    if regressions:
+        sys.exit('{} benchmark(s) regressed by more than {:.0%}'.format(
+            len(regressions), threshold))
+
+
+main = subcommands(run=run, compare=compare)
+
+
+if __name__ == '__main__':
+    main.execute()
@@ -1,3 +1,12 @@
+from ._utils import main_daemon_socket as _main_daemon_socket
+
+# If a daemon is serving this script (see hashbang.daemon), forward the
+# execution to it before anything else is imported
+if _main_daemon_socket() is not None:
+    from .daemon import _forward_main
+    _forward_main()
+
 from .hashbang import *
+from .configfile import ConfigFile
 
 name = 'hashbang'
@@ -0,0 +1,63 @@
+'''
+Support for commands implemented as `async def` functions or async generators.
+asyncio is only imported when such a command is executed, since it is slow to
+import.
+'''
+
+import asyncio
+import sys
+
+
+def _import_uvloop():
+    try:
+        import uvloop
+        return uvloop
+    except ImportError:
+        return None
+
+
+def _new_event_loop():
+    uvloop = _import_uvloop()
+    if uvloop is None:
+        return asyncio.new_event_loop()
+    return uvloop.new_event_loop()
+
+
+def run(awaitable):
+    '''
+    Runs `awaitable` on a new event loop and returns its result. uvloop is used
+    if it is installed. Like `asyncio.run`, a KeyboardInterrupt cancels the
+    running tasks before it is raised.
+    '''
+    if sys.version_info >= (3, 11):
+        with asyncio.Runner(loop_factory=_new_event_loop) as runner:
+            return runner.run(awaitable)
+    uvloop = _import_uvloop()
+    if uvloop is not None:
+        # Before Python 3.11, asyncio.run always creates the loop from the
+        # event loop policy
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    if not hasattr(asyncio, 'run'):
+        # Python 3.6 and below
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(awaitable)
+        finally:
+            loop.close()
+    return asyncio.run(awaitable)
+
+
+async def _stream(agen, processor):
+    try:
+        async for value in agen:
+            processor(value)
+    finally:
+        await agen.aclose()
+
+
+def stream(agen, processor):
+    '''
+    Runs the async generator `agen`, passing each of the values to `processor`
+    as they are generated.
+    '''
+    run(_stream(agen, processor))
@@ -0,0 +1,99 @@
+'''
+An index for large sets of choices, e.g. `Argument(choices=...)` generated from
+an inventory, or the table of `subcommands()`.
+
+argparse checks whether a value is one of the choices with a linear search,
+lists every choice in the usage and error messages, and the completion filters
+every choice with the validator. For a few choices that does not matter, but
+with tens of thousands of them it dominates the run time and makes the help
+message unreadable.
+'''
+
+from bisect import bisect_left
+
+# Choices with more items than this are indexed
+INDEX_THRESHOLD = 100
+# The number of choices shown in the usage, help and error messages when the
+# choices are indexed
+_SHOWN = 5
+
+
+def index(choices):
+    '''
+    Returns `choices` as `IndexedChoices` if it has more than
+    `INDEX_THRESHOLD` items which are all strings, or `choices` unchanged
+    otherwise.
+    '''
+    if choices is None or isinstance(choices, IndexedChoices):
+        return choices
+    try:
+        if len(choices) <= INDEX_THRESHOLD:
+            return choices
+    except TypeError:
+        return choices
+    items = tuple(choices)
+    if not all(isinstance(item, str) for item in items):
+        return choices
+    return IndexedChoices(items)
+
+
+class IndexedChoices:
+    '''
+    A read-only collection of string choices, which keeps the original order
+    for iteration, with a hash set for membership checks and a sorted list to
+    look up the choices with a given prefix. The set and the sorted list are
+    only created when first used, so that commands which do not need them do
+    not pay for them.
+    '''
+
+    def __init__(self, items):
+        self.items = tuple(items)
+        self._set = None
+        self._sorted = None
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __contains__(self, value):
+        if self._set is None:
+            self._set = frozenset(self.items)
+        return value in self._set
+
+    def __getstate__(self):
+        # Only the items are pickled (e.g. by the parser cache). The indexes
+        # are cheaper to rebuild than to load.
+        return {'items': self.items}
+
+    def __setstate__(self, state):
+        self.__init__(state['items'])
+
+    def with_prefix(self, prefix):
+        '''
+        Returns an iterator of the choices starting with `prefix`, in sorted
+        order.
+        '''
+        if self._sorted is None:
+            self._sorted = sorted(set(self.items))
+        choices = self._sorted
+        for i in range(bisect_left(choices, prefix), len(choices)):
+            if not choices[i].startswith(prefix):
+                return
+            yield choices[i]
+
+    def metavar(self):
+        '''
+        The truncated list of choices shown in the usage and help messages,
+        e.g. `{a,b,c,d,e,...}`.
+        '''
+        return '{{{},...}}'.format(','.join(self.items[:_SHOWN]))
+
+    def summary(self):
+        '''
+        The truncated list of choices shown in error messages.
+        '''
+        return '{}, ... ({} more)'.format(
+            ', '.join(repr(item) for item in self.items[:_SHOWN]),
+            len(self.items) - _SHOWN)
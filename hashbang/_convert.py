@@ -0,0 +1,227 @@
+'''
+Converters derived from the annotations of the parameters, for arguments which
+do not specify `Argument(type=...)`.
+
+The converters are created once for each annotation and used as the `type` of
+the argparse action, so argparse still reports invalid values as usual. For
+var-positional and `append` arguments, where the same value is often given
+many times (e.g. the paths from `find`), the results of converters which are
+more expensive than a dict lookup are memoized.
+
+Numeric arguments with `Argument(container=...)` are instead converted all at
+once into an array by `ContainerAction`.
+'''
+
+import argparse
+import sys
+
+# Plain types which convert a string by calling the type itself
+_SIMPLE_TYPES = (
+    ('builtins', 'int'),
+    ('builtins', 'float'),
+    ('builtins', 'complex'),
+    ('decimal', 'Decimal'),
+    ('fractions', 'Fraction'),
+)
+# The maximum number of values a memoized converter remembers
+_MEMO_SIZE = 64 * 1024
+# The types of the values of `Argument(container=...)`, and the corresponding
+# array typecodes and NumPy dtypes
+CONTAINERS = ('array', 'ndarray')
+_TYPECODES = {int: 'q', float: 'd'}
+_NUMPY_DTYPES = {int: 'int64', float: 'float64'}
+# Converters already derived, keyed by annotation. The values are
+# (converter, memoizable).
+_converters = {}
+
+
+def argument_type(argument, param):
+    '''
+    Returns the callable used to convert the values of `param`: the `type` of
+    `argument` if given, or the converter derived from the annotation of
+    `param`, or `None` if the values are passed as strings.
+    '''
+    from .hashbang import Argument
+    if argument.type is not None or param is None:
+        return argument.type
+    annotation = param.annotation
+    if annotation is param.empty or isinstance(annotation, Argument):
+        return None
+    converter, memoizable = from_annotation(annotation)
+    if memoizable and (argument.append or param.kind is param.VAR_POSITIONAL):
+        return Memoized(converter)
+    return converter
+
+
+def from_annotation(annotation):
+    '''
+    Returns `(converter, memoizable)` for the annotation, where `converter`
+    is `None` for annotations which are not converted (e.g. `str`, `bool`,
+    string annotations and unknown types).
+    '''
+    try:
+        return _converters[annotation]
+    except KeyError:
+        pass
+    except TypeError:
+        # Unhashable annotations are not types
+        return (None, False)
+    result = _derive(annotation)
+    _converters[annotation] = result
+    return result
+
+
+def _derive(annotation):
+    optional = _optional_type(annotation)
+    if optional is not None:
+        return from_annotation(optional)
+    if not isinstance(annotation, type):
+        return (None, False)
+    if (annotation.__module__, annotation.__qualname__) in _SIMPLE_TYPES:
+        return (annotation, annotation.__module__ != 'builtins')
+    # Only check the modules the annotation could come from if they have been
+    # imported, since the annotation cannot be one of their types otherwise
+    pathlib = sys.modules.get('pathlib')
+    if pathlib is not None and issubclass(annotation, pathlib.PurePath):
+        return (annotation, True)
+    enum = sys.modules.get('enum')
+    if enum is not None and issubclass(annotation, enum.Enum):
+        return (EnumConverter(annotation), False)
+    datetime = sys.modules.get('datetime')
+    if datetime is not None and issubclass(
+            annotation, (datetime.date, datetime.time)):
+        return (IsoFormatConverter(annotation), True)
+    return (None, False)
+
+
+def _optional_type(annotation):
+    '''
+    Returns `X` if the annotation is `Optional[X]` (or `X | None`), or `None`
+    otherwise.
+    '''
+    args = getattr(annotation, '__args__', None)
+    if not isinstance(args, tuple):
+        return None
+    typing = sys.modules.get('typing')
+    is_union = (
+        (typing is not None and
+         getattr(annotation, '__origin__', None) is typing.Union) or
+        type(annotation).__name__ == 'UnionType')
+    if not is_union:
+        return None
+    types = [arg for arg in args if arg is not type(None)]
+    if len(types) != 1 or len(args) != 2:
+        return None
+    return types[0]
+
+
+class EnumConverter:
+    '''
+    Converts a string to the member of `enum` with that name, or otherwise
+    with that value.
+    '''
+
+    def __init__(self, enum):
+        self.enum = enum
+        self.__name__ = enum.__name__
+
+    def __call__(self, value):
+        import argparse
+        try:
+            return self.enum[value]
+        except KeyError:
+            pass
+        for member in self.enum:
+            if str(member.value) == value:
+                return member
+        names = ', '.join(repr(name) for name in self.enum.__members__)
+        raise argparse.ArgumentTypeError(
+            'invalid choice: {!r} (choose from {})'.format(value, names))
+
+
+class IsoFormatConverter:
+    '''
+    Converts a string in ISO 8601 format to a `datetime`, `date` or `time`.
+    '''
+
+    def __init__(self, type):
+        self.type = type
+        self.__name__ = type.__name__
+
+    def __call__(self, value):
+        return self.type.fromisoformat(value)
+
+
+class Memoized:
+    '''
+    Wraps `converter`, reusing the converted values of strings that were
+    converted before.
+    '''
+
+    def __init__(self, converter):
+        self.converter = converter
+        self.__name__ = getattr(converter, '__name__', repr(converter))
+        self.cache = {}
+
+    def __call__(self, value):
+        try:
+            return self.cache[value]
+        except KeyError:
+            pass
+        result = self.converter(value)
+        if len(self.cache) >= _MEMO_SIZE:
+            self.cache.clear()
+        self.cache[value] = result
+        return result
+
+    def __getstate__(self):
+        # The parser cache does not need the converted values
+        state = dict(self.__dict__)
+        state['cache'] = {}
+        return state
+
+
+class ContainerAction(argparse.Action):
+    '''
+    Converts all the values of a positional argument in one pass, into an
+    `array.array` or a NumPy `ndarray` of `numeric_type` (`int` or `float`),
+    instead of converting them one by one into a list.
+    '''
+
+    def __init__(self, *args, container, numeric_type, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.container = container
+        self.numeric_type = numeric_type
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        try:
+            if self.container == 'ndarray':
+                result = self._ndarray(values)
+            else:
+                import array
+                result = array.array(_TYPECODES[self.numeric_type],
+                                     map(self.numeric_type, values))
+        except (ValueError, OverflowError):
+            raise argparse.ArgumentError(self, 'invalid {} value: {!r}'.format(
+                self.numeric_type.__name__, self._invalid_value(values)))
+        setattr(namespace, self.dest, result)
+
+    def _ndarray(self, values):
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError(
+                'container="ndarray" requires the "numpy" package')
+        # NumPy parses the whole array of strings in C
+        return numpy.array(values, dtype=str).astype(
+            _NUMPY_DTYPES[self.numeric_type])
+
+    def _invalid_value(self, values):
+        import array
+        typecode = _TYPECODES[self.numeric_type]
+        for value in values:
+            try:
+                array.array(typecode, [self.numeric_type(value)])
+            except (ValueError, OverflowError):
+                return value
+        return None
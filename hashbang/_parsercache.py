@@ -0,0 +1,151 @@
+'''
+On-disk cache for the argument spec resolved by `HashbangCommand`.
+
+Creating the parser involves inspecting the docstring, wrapping every parameter
+in an `Argument`, applying the extensions and calling `add_argument` for each
+of them. The result of all that is the list of `argparse.Action`s created by
+`add_argument`, which is recorded by `_CommandParser` and stored here, keyed by
+the modification times and sizes of the script and of the hashbang sources. On
+the next run the actions are attached to a new parser directly, which also
+skips the validation `add_argument` performs on every call.
+
+Other modules imported by the script are not part of the key, so a cached
+parser whose `choices` or defaults come from another module is not updated
+when that module changes. Touch the script, or remove the cache directory, to
+rebuild it.
+'''
+
+import os
+import sys
+import zlib
+
+from ._utils import cache_dir, source_files
+
+_SPEC_VERSION = 1
+
+
+def _script_path(cmd):
+    module = sys.modules.get(cmd.func.__module__)
+    path = getattr(module, '__file__', None)
+    return os.path.abspath(path) if path else None
+
+
+def is_cacheable(cmd):
+    '''
+    Whether the parser of `cmd` can be cached. Only commands whose arguments
+    and extensions are all plain `Argument`s are cacheable, since arbitrary
+    extensions can have side effects on the command (e.g. reading a config file
+    or setting `return_value_processor`) that replaying the spec would skip.
+    '''
+    from .hashbang import Argument
+    if os.environ.get('_ARGCOMPLETE'):
+        # Completion attaches completers to the argparse actions, which are
+        # not part of the spec
+        return False
+    if _script_path(cmd) is None:
+        return False
+    for extension in cmd.extensions:
+        if type(extension) is not Argument:
+            return False
+    for param in cmd.signature.parameters.values():
+        if (isinstance(param.annotation, Argument) and
+                type(param.annotation) is not Argument):
+            return False
+    return True
+
+
+class ParserSpecCache:
+    '''
+    The cache entry for a single command. `location` is either `True`, to use
+    the user cache directory, or the directory to store the entry in.
+    '''
+
+    def __init__(self, cmd, location):
+        self.cmd = cmd
+        self.script = _script_path(cmd)
+        directory = (cache_dir('parsers') if location is True
+                     else str(location))
+        name = '{}.{}.{:08x}.pickle'.format(
+            os.path.basename(self.script), cmd.func.__qualname__,
+            zlib.crc32(self.script.encode()))
+        self.path = os.path.join(directory, name)
+        self._digest = None
+
+    @property
+    def digest(self):
+        '''
+        Identifies the versions of the script, the hashbang sources and
+        Python, by the modification times and sizes of the files. This is
+        computed on every run, so the files are not read.
+        '''
+        if self._digest is None:
+            digest = [sys.version]
+            for path in [self.script] + source_files():
+                stat = os.stat(path)
+                digest += [stat.st_mtime_ns, stat.st_size]
+            self._digest = tuple(digest)
+        return self._digest
+
+    def load(self):
+        '''
+        Returns the cached spec, or `None` if there is no valid cache entry.
+        '''
+        import pickle
+        try:
+            with open(self.path, 'rb') as f:
+                version, digest, spec = pickle.load(f)
+        except Exception:
+            return None
+        if version != _SPEC_VERSION or digest != self.digest:
+            return None
+        return spec
+
+    def store(self, spec):
+        '''
+        Writes `spec` to the cache. Specs that cannot be pickled (e.g. because
+        `type` or `choices` is a lambda) are silently not cached.
+        '''
+        import pickle
+        try:
+            data = pickle.dumps((_SPEC_VERSION, self.digest, spec))
+        except Exception:
+            return
+        tmp = '{}.{}.tmp'.format(self.path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+
+def action_state(action):
+    '''
+    Returns the picklable state of an `argparse.Action`, without the reference
+    to the container it was added to.
+    '''
+    return {key: value for key, value in vars(action).items()
+            if key != 'container'}
+
+
+def replay(parser, calls):
+    '''
+    Attaches the actions recorded by `_CommandParser` to `parser`.
+    '''
+    import argparse
+    containers = {}
+    for index, call in enumerate(calls):
+        if call[0] == 'mutually_exclusive_group':
+            containers[index] = parser.add_mutually_exclusive_group(**call[1])
+        else:
+            _, container, action_class, state = call
+            action = action_class.__new__(action_class)
+            action.__dict__.update(state)
+            # argparse compares these against SUPPRESS by identity, which is
+            # lost when the spec is unpickled
+            for key in ('default', 'help', 'dest'):
+                if getattr(action, key, None) == argparse.SUPPRESS:
+                    setattr(action, key, argparse.SUPPRESS)
+            target = parser if container is None else containers[container]
+            target._add_action(action)
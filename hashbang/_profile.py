@@ -0,0 +1,130 @@
+'''
+Profiles the execution of a command, when the hidden option
+`--hashbang-profile=PATH` is given on the command line, or the environment
+variable `HASHBANG_PROFILE=PATH` is set.
+
+The profiler runs from the call of the function until its return value has
+been processed (so that generators are profiled as they are consumed). The
+format of the output depends on the extension of `PATH`:
+
+-   `.folded` or `.collapsed` - A statistical profile from a sampling profiler
+    using `SIGPROF`, written as collapsed stacks (one line per stack, with the
+    frames separated by `;` followed by the number of samples), which can be
+    turned into a flame graph with e.g. `flamegraph.pl` or speedscope. The
+    sampling interval in seconds can be set with
+    `HASHBANG_PROFILE_INTERVAL` (default `0.001`). Only available on Unix, and
+    only in the main thread.
+-   Otherwise - A deterministic profile from `cProfile`, written in the
+    `pstats` format, which can be read with `python -m pstats PATH` or
+    visualized with e.g. snakeviz.
+
+When the option is given to a delegator, it is passed on to the command the
+delegator delegates to, so that only the leaf command is profiled.
+'''
+
+import os
+import sys
+
+# The dest of the hidden --hashbang-profile option
+DEST = '_hashbang_profile'
+_SAMPLED_EXTENSIONS = ('.folded', '.collapsed')
+
+# The profile path given to a delegator, to be used by the delegate
+_pending = None
+# The running profiler, and the command that started it
+_active = None
+
+
+def add_option(parser):
+    import argparse
+    parser.add_argument(
+        '--hashbang-profile',
+        dest=DEST,
+        metavar='PATH',
+        default=argparse.SUPPRESS,
+        help=argparse.SUPPRESS)
+
+
+def start(cmd, opts, delegator):
+    '''
+    Starts profiling `cmd` if requested by the parsed options `opts` (from
+    which the option is removed), by a delegator of `cmd`, or by the
+    environment. If `cmd` is a delegator, the request is passed on to its
+    delegate instead.
+    '''
+    global _pending, _active
+    path = opts.pop(DEST, None) or _pending
+    if delegator:
+        _pending = path
+        return
+    _pending = None
+    path = path or os.environ.get('HASHBANG_PROFILE')
+    if not path or _active is not None:
+        return
+    if path.endswith(_SAMPLED_EXTENSIONS):
+        profiler = _Sampler(
+            float(os.environ.get('HASHBANG_PROFILE_INTERVAL', '0.001')))
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+    _active = (cmd, path, profiler)
+    profiler.enable()
+
+
+def stop(cmd):
+    '''
+    Stops the profiler if it was started for `cmd`, and writes the profile.
+    '''
+    global _active
+    if _active is None or _active[0] is not cmd:
+        return
+    _, path, profiler = _active
+    _active = None
+    profiler.disable()
+    profiler.dump_stats(path)
+    print('hashbang: Wrote profile to {}'.format(path), file=sys.stderr)
+
+
+class _Sampler:
+    '''
+    A sampling profiler which records the stack of the main thread every time
+    `SIGPROF` is received, with the same `enable`, `disable` and `dump_stats`
+    methods as `cProfile.Profile`.
+    '''
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = {}
+        self._previous_handler = None
+
+    def enable(self):
+        import signal
+        import threading
+        if not hasattr(signal, 'setitimer'):
+            raise RuntimeError(
+                'The sampling profiler is not supported on this platform')
+        if threading.current_thread() is not threading.main_thread():
+            raise RuntimeError(
+                'The sampling profiler can only be used in the main thread')
+        self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def disable(self):
+        import signal
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._previous_handler)
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('{} ({}:{})'.format(
+                code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        key = ';'.join(reversed(stack))
+        self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def dump_stats(self, path):
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write('{} {}\n'.format(stack, count))
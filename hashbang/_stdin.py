@@ -0,0 +1,64 @@
+'''
+Reads the lines of stdin, or of the files given on the command line, lazily
+for arguments declared with `Argument(stdin=True)`.
+'''
+
+import argparse
+import sys
+
+# The buffer size used to read files. Larger reads make a noticeable
+# difference on inputs of many GB.
+_BUFFER_SIZE = 1024 * 1024
+
+
+class ReadLinesAction(argparse.Action):
+    '''
+    Stores a lazy iterator over the lines of the files given to a positional
+    argument, instead of the list of file names. `-` and the absence of files
+    stand for stdin.
+    '''
+
+    def __init__(self, *args, chunk_size=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chunk_size = chunk_size
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        lines = read_lines(values or ['-'])
+        if self.chunk_size is not None:
+            lines = chunks(lines, self.chunk_size)
+        setattr(namespace, self.dest, lines)
+
+
+def read_lines(paths):
+    '''
+    Yields the lines of each of `paths` in order, without the trailing
+    newline. Each file is only opened once the lines before it have been
+    consumed.
+    '''
+    for path in paths:
+        if path == '-':
+            yield from _strip_newlines(sys.stdin)
+            continue
+        try:
+            f = open(path, 'r', buffering=_BUFFER_SIZE)
+        except OSError as e:
+            raise RuntimeError('Cannot read {}: {}'.format(path, e.strerror))
+        with f:
+            yield from _strip_newlines(f)
+
+
+def _strip_newlines(f):
+    for line in f:
+        yield line[:-1] if line.endswith('\n') else line
+
+
+def chunks(lines, chunk_size):
+    '''
+    Yields lists of `chunk_size` lines, the last of which may be shorter.
+    '''
+    from itertools import islice
+    while True:
+        chunk = list(islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,153 @@
+'''
+Records how long each phase of executing a command takes, when the environment
+variable `HASHBANG_TIMINGS` is set:
+
+-   `HASHBANG_TIMINGS=1` - Write the timings to stderr when the process exits.
+-   `HASHBANG_TIMINGS=/path/to/timings.jsonl` - Append the timings to the
+    file instead.
+
+The timings of a run are written as a single line of JSON, with the list of
+phases in the order they started. Each phase has the name of the phase and of
+the command, the nesting depth (e.g. the phases of a subcommand are nested in
+the `call` phase of its delegator), and the start time and duration in
+milliseconds. Times are relative to when hashbang was imported, so the
+`import` phase only covers the imports and definitions of the script after
+hashbang itself is imported (use `python -X importtime` for the rest).
+
+When the variable is not set, `phase` returns a shared no-op context manager,
+so the cost of the instrumentation is a function call per phase.
+'''
+
+import os
+import sys
+import time
+
+# The time hashbang was imported, which the times are relative to
+_start = time.perf_counter()
+_destination = None
+_records = []
+_local = None
+_import_recorded = False
+
+
+class _NoPhase:
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+class _Phase:
+
+    __slots__ = ('name', 'cmd', 'fields', 'start')
+
+    def __init__(self, name, cmd, fields):
+        self.name = name
+        self.cmd = cmd
+        self.fields = fields
+        self.start = None
+
+    def __enter__(self):
+        _stack().append(self)
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        stack = _stack()
+        stack.pop()
+        _record(self.name, self.cmd, len(stack), self.start, end, self.fields)
+
+
+def configure(restart=False):
+    '''
+    Reads `HASHBANG_TIMINGS` from the environment. This is called when
+    hashbang is imported, and again by daemon workers after they receive the
+    environment of the client, with `restart=True` to measure the times from
+    the start of the request instead.
+    '''
+    global _destination, _local, _start, _import_recorded
+    if restart:
+        _start = time.perf_counter()
+        _import_recorded = True
+    value = os.environ.get('HASHBANG_TIMINGS')
+    _destination = value if value and value != '0' else None
+    if _destination is not None and _local is None:
+        import atexit
+        import threading
+        _local = threading.local()
+        atexit.register(flush)
+
+
+def phase(name, cmd=None, **fields):
+    '''
+    Returns a context manager which records the time spent in it as the phase
+    `name` of the `HashbangCommand` `cmd`. Extra `fields` are added to the
+    record.
+    '''
+    if _destination is None:
+        return _NO_PHASE
+    return _Phase(name, cmd, fields)
+
+
+def record_import():
+    '''
+    Records the time between importing hashbang and the first execution of a
+    command as the `import` phase.
+    '''
+    global _import_recorded
+    if _destination is None or _import_recorded:
+        return
+    _import_recorded = True
+    _record('import', None, 0, _start, time.perf_counter(), {})
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _record(name, cmd, depth, start, end, fields):
+    record = {
+        'phase': name,
+        'command': cmd.func.__name__ if cmd is not None else None,
+        'depth': depth,
+        'start_ms': round((start - _start) * 1000, 3),
+        'duration_ms': round((end - start) * 1000, 3),
+    }
+    record.update(fields)
+    _records.append(record)
+
+
+def flush():
+    '''
+    Writes the recorded timings, if any, to the destination given by
+    `HASHBANG_TIMINGS`.
+    '''
+    if _destination is None or not _records:
+        return
+    import json
+    records = sorted(
+        _records, key=lambda record: (record['start_ms'], record['depth']))
+    del _records[:]
+    line = json.dumps({
+        'argv': sys.argv,
+        'pid': os.getpid(),
+        'total_ms': round((time.perf_counter() - _start) * 1000, 3),
+        'phases': records,
+    })
+    if _destination == '1':
+        sys.stderr.write(line + '\n')
+        sys.stderr.flush()
+    else:
+        with open(_destination, 'a') as f:
+            f.write(line + '\n')
+
+
+configure()
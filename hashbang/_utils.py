@@ -1,5 +1,7 @@
 import functools
+import os
 import sys
+import zlib
 
 
 def optionalarg(decorator):
@@ -19,3 +21,67 @@ def optionalarg(decorator):
             return __impl
 
     return __decorator
+
+
+def cache_dir(*parts):
+    '''
+    Returns the directory hashbang stores its caches in, following the XDG base
+    directory specification (`$XDG_CACHE_HOME/hashbang`, or
+    `~/.cache/hashbang`). The directory is not created.
+    '''
+    base = os.environ.get('XDG_CACHE_HOME')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'hashbang', *parts)
+
+
+def source_files():
+    '''
+    Returns the paths of the Python sources of the hashbang package, in a
+    stable order. Used to key caches that must be invalidated when hashbang
+    itself changes.
+    '''
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    return sorted(
+        os.path.join(package_dir, name) for name in os.listdir(package_dir)
+        if name.endswith('.py'))
+
+
+def runtime_dir(*parts):
+    '''
+    Returns the directory for hashbang's sockets, `$XDG_RUNTIME_DIR/hashbang`,
+    or a per-user directory in `$TMPDIR` if that is not set. The directory is
+    not created.
+    '''
+    base = os.environ.get('XDG_RUNTIME_DIR')
+    if base:
+        return os.path.join(base, 'hashbang', *parts)
+    return os.path.join(
+        os.environ.get('TMPDIR') or '/tmp',
+        'hashbang-{}'.format(os.getuid()), *parts)
+
+
+def daemon_socket(script):
+    '''
+    Returns the path of the socket of the daemon serving `script`. The name is
+    kept short since socket paths are limited to about 100 characters.
+    '''
+    script = os.path.abspath(script)
+    return runtime_dir('{}.{:08x}.sock'.format(
+        os.path.basename(script)[:32], zlib.crc32(script.encode())))
+
+
+def main_daemon_socket():
+    '''
+    Returns the socket path of the daemon serving the `__main__` script, or
+    `None` if there is no such socket. This only checks that the socket file
+    exists, not whether the daemon is alive, so it is cheap enough to be called
+    when hashbang is imported.
+    '''
+    if not hasattr(os, 'fork') or '_ARGCOMPLETE' in os.environ:
+        return None
+    script = getattr(sys.modules.get('__main__'), '__file__', None)
+    if not script:
+        return None
+    path = daemon_socket(script)
+    return path if os.path.exists(path) else None
@@ -0,0 +1,148 @@
+'''
+Runs a command for each record read from stdin, like `xargs -n1`, in a single
+process.
+'''
+
+import argparse
+import sys
+from collections import deque
+
+from .hashbang import Argument, _ARGS_DEST, _StopParsing
+
+__all__ = ['Batch']
+
+# The formats of the records read from stdin
+_FORMATS = ('line', 'nul')
+
+
+class Batch(Argument):
+    '''
+    An extension that adds the flag `--hashbang-batch` to the command. When
+    this flag is given, the records read from stdin are appended to the rest
+    of the command line arguments, and the command is executed once for each
+    record. Since this reuses the same process and parser, it is much faster
+    than `xargs -n1 command.py`.
+
+    ```sh
+    $ printf 'a.txt\\n"b c.txt"\\n' | compress.py --level 3 --hashbang-batch
+    # Same as running `compress.py --level 3 a.txt` and
+    # `compress.py --level 3 "b c.txt"`
+    ```
+
+    -   `--hashbang-batch` or `--hashbang-batch=line` - Each line of stdin is
+        a record, which is split into arguments using shell syntax. Blank
+        lines are ignored.
+    -   `--hashbang-batch=nul` - Records are separated by NUL characters, and
+        each record is a single argument, like `xargs -0 -n1`.
+    -   `--hashbang-batch-jobs N` - Run up to N records at the same time in a
+        thread pool. The function must be thread-safe in this case.
+
+    The exit status of each record which did not succeed is reported on
+    stderr. Like xargs, the exit code is 0 if all records succeeded, 123 if
+    any record exited with a status from 1 to 254, and 124 if a record exited
+    with status 255, in which case the remaining records are not run.
+    '''
+
+    def apply_hashbang_extension(self, cmd):
+        cmd.arguments['_batch'] = (None, self)
+        invoker = cmd.invoker
+
+        def batch_invoker(func, args, kwargs, opts):
+            batch = opts.pop('hashbang_batch', None)
+            opts.pop('hashbang_batch_jobs', None)
+            if batch is None:
+                return invoker(func, args, kwargs, opts)
+            exit_code = _run_batch(cmd, batch)
+            if exit_code != 0:
+                raise SystemExit(exit_code)
+
+        cmd.invoker = batch_invoker
+
+    def add_argument(self, cmd, parser, param):
+        class BatchAction(argparse.Action):
+
+            def __call__(_, parser, namespace, values, option_string=None):
+                # The other arguments, including the required ones, are given
+                # by the records, so stop parsing and record the arguments to
+                # run the batch with once the invoker is called
+                args = getattr(namespace, _ARGS_DEST, None)
+                setattr(namespace, _.dest,
+                        args if args is not None else sys.argv[1:])
+                raise _StopParsing()
+
+        parser.add_argument(
+            '--hashbang-batch',
+            nargs='?',
+            const='line',
+            choices=_FORMATS,
+            metavar='FORMAT',
+            action=BatchAction,
+            help='Run the command for each record read from stdin, in the '
+                 'format "line" (default) or "nul"')
+        parser.add_argument(
+            '--hashbang-batch-jobs',
+            type=int,
+            metavar='N',
+            help='Number of records to run at the same time')
+
+
+def _records(stream, format):
+    '''
+    Yields the lists of arguments read from `stream`.
+    '''
+    if format == 'nul':
+        pending = ''
+        for chunk in iter(lambda: stream.read(65536), ''):
+            *records, pending = (pending + chunk).split('\0')
+            for record in records:
+                if record:
+                    yield [record]
+        if pending:
+            yield [pending]
+    else:
+        import shlex
+        for line in stream:
+            record = shlex.split(line)
+            if record:
+                yield record
+
+
+def _run_batch(cmd, args):
+    '''
+    Runs `cmd` for each record in stdin, with the options in the list of
+    command line arguments `args`, returning the exit code.
+    '''
+    import shlex
+    options_parser = argparse.ArgumentParser(
+        add_help=False, allow_abbrev=False)
+    options_parser.add_argument(
+        '--hashbang-batch', nargs='?', const='line', choices=_FORMATS)
+    options_parser.add_argument('--hashbang-batch-jobs', type=int)
+    options, prefix = options_parser.parse_known_args(args)
+
+    # The records that are being run, in the same order as the results from
+    # execute_many
+    running = deque()
+
+    def argvs():
+        for record in _records(sys.stdin, options.hashbang_batch):
+            running.append(record)
+            yield prefix + record
+
+    exit_code = 0
+    results = cmd.execute_many(argvs(), workers=options.hashbang_batch_jobs)
+    try:
+        for _, code in results:
+            record = running.popleft()
+            if code == 0:
+                continue
+            sys.stdout.flush()
+            print('{}: exited with status {}'.format(
+                      ' '.join(shlex.quote(arg) for arg in record), code),
+                  file=sys.stderr)
+            if code == 255:
+                return 124
+            exit_code = 123
+    finally:
+        results.close()
+    return exit_code
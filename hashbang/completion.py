@@ -1,35 +1,255 @@
-try:
-    import argcomplete
-except ImportError:
-    argcomplete = None
-
 import argparse
 import os
 import sys
-import traceback
 from inspect import Parameter
 
+from ._choices import IndexedChoices
+from ._utils import cache_dir
+
+# argcomplete is only needed when the shell is asking for completions, which it
+# signals by setting _ARGCOMPLETE. Skip the import otherwise, since it is a
+# significant part of the startup time.
+argcomplete = None
+if '_ARGCOMPLETE' in os.environ:
+    try:
+        import argcomplete
+    except ImportError:
+        pass
+
 __all__ = [
     'prefix_validator',
-    'fuzzy_path_validator'
+    'fuzzy_path_validator',
+    'FuzzyIndex',
+    'FuzzyMatcher',
 ]
 
 
-def _add_argument(argument, argparse_argument):
+def _add_argument(cmd, argument, argparse_argument):
     if argcomplete is not None:
         completer = argument.completer
         if completer is None and argument.choices is not None:
             completer = argcomplete.completers.\
                         ChoicesCompleter(argument.choices)
+        elif completer is not None and argument.completion_cache_ttl:
+            completer = _CachedCompleter(
+                completer, argument.completion_cache_ttl,
+                (os.path.abspath(sys.argv[0]), cmd.func.__qualname__,
+                 argparse_argument.dest))
         if completer is not None:
             validator = argument.completion_validator or prefix_validator
+            choices = argparse_argument.choices
+            rank = getattr(validator, 'rank', None)
+            if rank is not None:
+                # The validator ranks all of the completions, e.g.
+                # FuzzyMatcher
+                def candidates(prefix, **kwargs):
+                    return rank(completer(**kwargs), prefix)
+            elif (argument.completer is None and
+                    validator is prefix_validator and
+                    isinstance(choices, IndexedChoices)):
+                # Look up the matching choices in the index instead of
+                # checking every one of them
+                def candidates(prefix, **kwargs):
+                    return choices.with_prefix(prefix)
+            else:
+                def candidates(prefix, **kwargs):
+                    return (c for c in completer(**kwargs)
+                            if validator(c, prefix))
 
             def validated(prefix, **kwargs):
-                choices = completer(**kwargs)
-                return [c for c in choices if validator(c, prefix)]
+                return _collect(
+                    lambda: candidates(prefix, **kwargs),
+                    argument.max_completions,
+                    argument.completion_timeout)
             argparse_argument.completer = validated
 
 
+def _collect(candidates, limit, timeout):
+    '''
+    Returns up to `limit` items from the iterable returned by `candidates()`.
+    If `timeout` is not `None`, returns the items produced within `timeout`
+    seconds, leaving the rest of the iterable unconsumed.
+    '''
+    from itertools import islice
+    if timeout is None:
+        return list(islice(candidates(), limit))
+
+    import threading
+    results = []
+    lock = threading.Lock()
+
+    def consume():
+        for candidate in islice(candidates(), limit):
+            with lock:
+                results.append(candidate)
+
+    # The thread is a daemon thread so that it does not keep the process alive
+    # if the completer is still running when the deadline expires
+    thread = threading.Thread(target=consume, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    with lock:
+        return list(results)
+
+
+# The maximum total size of the completion cache. The least recently used
+# entries are removed when the cache grows larger than this.
+_MAX_CACHE_BYTES = 8 * 1024 * 1024
+# Entries older than the TTL are still used (while they are refreshed in the
+# background) until they are older than this many times the TTL
+_STALE_FACTOR = 10
+
+
+class _CachedCompleter:
+    '''
+    Wraps `completer` to cache its results on disk for `ttl` seconds. The
+    results are cached by `key`, the working directory and the other parsed
+    arguments, and are filtered by the prefix by the caller as usual, so every
+    keystroke can reuse the same entry.
+    '''
+
+    def __init__(self, completer, ttl, key):
+        self.completer = completer
+        self.ttl = ttl
+        self.key = key
+
+    def __call__(self, **kwargs):
+        import hashlib
+        import json
+        import time
+        parsed_args = kwargs.get('parsed_args')
+        dest = self.key[-1]
+        key = json.dumps([
+            self.key,
+            os.getcwd(),
+            sorted((name, repr(value)) for name, value
+                   in vars(parsed_args or argparse.Namespace()).items()
+                   if name != dest),
+        ])
+        path = os.path.join(
+            cache_dir('completions'),
+            hashlib.sha1(key.encode()).hexdigest() + '.json')
+        entry = _read_cache_entry(path, key)
+        if entry is not None:
+            age = time.time() - entry['time']
+            if age < self.ttl * _STALE_FACTOR:
+                # Mark the entry as recently used
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+                if age >= self.ttl:
+                    self._refresh_in_background(path, key, kwargs)
+                return entry['values']
+        return self._refresh(path, key, kwargs)
+
+    def _refresh(self, path, key, kwargs):
+        values = [str(value) for value in self.completer(**kwargs)]
+        _write_cache_entry(path, key, values)
+        return values
+
+    def _refresh_in_background(self, path, key, kwargs):
+        lock = path + '.lock'
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            # Another process is refreshing the entry, unless the lock was
+            # left behind by a process that died
+            try:
+                if _age(lock) < self.ttl:
+                    return
+            except OSError:
+                return
+        if not hasattr(os, 'fork'):
+            os.unlink(lock)
+            return
+        pid = os.fork()
+        if pid:
+            os.waitpid(pid, 0)
+            return
+        try:
+            # Fork again so this process is not waited for by the shell
+            os.setsid()
+            if os.fork():
+                os._exit(0)
+        except BaseException:
+            try:
+                os.unlink(lock)
+            finally:
+                os._exit(0)
+        # Only the process refreshing the entry removes the lock
+        try:
+            # Close all file descriptors including the one argcomplete writes
+            # the completions to
+            os.closerange(0, _max_fd())
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                if fd != devnull:
+                    os.dup2(devnull, fd)
+            self._refresh(path, key, kwargs)
+        finally:
+            try:
+                os.unlink(lock)
+            finally:
+                os._exit(0)
+
+
+def _max_fd():
+    try:
+        return os.sysconf('SC_OPEN_MAX')
+    except (AttributeError, ValueError, OSError):
+        return 1024
+
+
+def _age(path):
+    import time
+    return time.time() - os.stat(path).st_mtime
+
+
+def _read_cache_entry(path, key):
+    import json
+    try:
+        with open(path, 'r') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return entry if entry.get('key') == key else None
+
+
+def _write_cache_entry(path, key, values):
+    import json
+    import time
+    directory = os.path.dirname(path)
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(tmp, 'w') as f:
+            json.dump({'key': key, 'time': time.time(), 'values': values}, f)
+        os.replace(tmp, path)
+        _evict(directory)
+    except OSError:
+        pass
+
+
+def _evict(directory):
+    '''
+    Removes the least recently used entries until the total size of the cache
+    is below `_MAX_CACHE_BYTES`.
+    '''
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith('.json'):
+            path = os.path.join(directory, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= _MAX_CACHE_BYTES:
+            break
+        os.unlink(path)
+        total -= size
+
+
 _container = {}
 
 
@@ -43,6 +263,7 @@ def _execute_complete(commandobj, args):
     finder = argcomplete.CompletionFinder(
         argument_parser=parser,
         always_complete_options=False,
+        exclude=['--help', '-h'],
         validator=lambda *_: True)
 
     active_parsers = finder._patch_argument_parser()
@@ -114,6 +335,7 @@ def _modify_parser(commandobj, parser, args):
 
                     return completions
                 except BaseException as e:
+                    import traceback
                     argcomplete.warn(e, traceback.print_exc())
 
         CompletionFinder(parser)(
@@ -134,3 +356,186 @@ def fuzzy_path_validator(completion, cword):
         if not full.lower().startswith(sub.lower()):
             return False
     return True
+
+
+class FuzzyIndex:
+    '''
+    The candidates for `FuzzyMatcher`, prepared so that all of them can be
+    matched with a single regular expression search. A completer can return a
+    `FuzzyIndex` created once (e.g. when the module is imported in daemon
+    mode) instead of a list, so that the candidates are not prepared again on
+    every keystroke. It iterates over the candidates like the list it was
+    created from.
+    '''
+
+    def __init__(self, candidates):
+        self.candidates = [str(candidate) for candidate in candidates]
+        lowered = [candidate.lower().replace('\n', ' ')
+                   for candidate in self.candidates]
+        # The candidates in lowercase, each preceded by a newline
+        self.text = ''.join('\n' + candidate for candidate in lowered) + '\n'
+        # The offset of the newline before each candidate in `text`, and of
+        # the newline at the end
+        self.offsets = [0]
+        for candidate in lowered:
+            self.offsets.append(self.offsets[-1] + len(candidate) + 1)
+
+    def __iter__(self):
+        return iter(self.candidates)
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def find(self, pattern):
+        '''
+        Yields `(i, match)` for the first match of the compiled `pattern` in
+        each candidate. The pattern must not match newlines, except for one at
+        its start to match the start of a candidate.
+        '''
+        from bisect import bisect_right
+        offsets = self.offsets
+        search = pattern.search
+        text = self.text
+        match = search(text)
+        while match is not None:
+            i = bisect_right(offsets, match.start(), hi=len(offsets) - 1) - 1
+            yield i, match
+            match = search(text, offsets[i + 1])
+
+
+class FuzzyMatcher:
+    '''
+    A `completion_validator` which matches the completions fuzzily and ranks
+    them by how well they match, best first.
+
+    ```python3
+    @command
+    def edit(path: Argument(completer=list_files,
+                            completion_validator=FuzzyMatcher(limit=20))):
+        ...
+    ```
+
+    A completion matches if each segment of the typed text (split by `sep`) is
+    a prefix of the corresponding segment of the completion, e.g. `ha/comp`
+    matches `hashbang/completion.py`. Otherwise it matches if the typed
+    characters appear in the completion in order, e.g. `hbcomp`. Matching
+    ignores case. Segment prefix matches are ranked first. Subsequence matches
+    are ranked by how many of the typed characters start a word or follow the
+    previous character. Shorter completions are ranked first otherwise.
+
+    ```python3
+    FuzzyMatcher(*, limit=None, sep=os.sep)
+    ```
+    -   `limit` - The maximum number of completions to return. Only the best
+        matches are kept, without sorting all of them.
+    -   `sep` - The separator of the segments, e.g. `.` to match Python module
+        names.
+    '''
+
+    def __init__(self, *, limit=None, sep=os.sep):
+        self.limit = limit
+        self.sep = sep
+        self._compiled = (None, None)
+
+    def __call__(self, completion, cword):
+        return self.score(completion, cword) is not None
+
+    def score(self, completion, cword):
+        '''
+        Returns the score of `completion` for the typed text `cword`, which is
+        greater for better matches, or `None` if it does not match.
+        '''
+        segments, subsequence = self._compile(cword)
+        text = '\n' + completion.lower().replace('\n', ' ') + '\n'
+        if segments.match(text):
+            return (1, 0, 2 - len(text))
+        match = subsequence.search(text)
+        if match is None:
+            return None
+        return (0, _subsequence_points(text, match), 2 - len(text))
+
+    def rank(self, candidates, cword):
+        '''
+        Returns the candidates matching `cword`, best first, up to `limit` of
+        them. `candidates` can be any iterable, or a `FuzzyIndex`.
+        '''
+        import heapq
+        from itertools import islice
+        if not isinstance(candidates, FuzzyIndex):
+            candidates = FuzzyIndex(candidates)
+        if not cword:
+            return list(islice(candidates, self.limit))
+        segments, subsequence = self._compile(cword)
+        offsets = candidates.offsets
+        scores = {}
+        for i, _ in candidates.find(segments):
+            scores[i] = (1, 0, offsets[i] - offsets[i + 1] + 1)
+        # Subsequence matches are always ranked after segment prefix matches,
+        # so they are not needed if there are enough of those
+        if self.limit is None or len(scores) < self.limit:
+            for i, match in candidates.find(subsequence):
+                if i not in scores:
+                    scores[i] = (
+                        0,
+                        _subsequence_points(candidates.text, match),
+                        offsets[i] - offsets[i + 1] + 1)
+        # Keep the original order of the candidates with equal scores
+        matches = [(score, -i) for i, score in scores.items()]
+        if self.limit is None:
+            matches.sort(reverse=True)
+        else:
+            matches = heapq.nlargest(self.limit, matches)
+        return [candidates.candidates[-i] for _, i in matches]
+
+    def _compile(self, cword):
+        '''
+        Returns the regular expressions matching the segment prefixes and the
+        subsequence of `cword`, for use with `FuzzyIndex.find`. The last one is
+        reused, since the validator is called with the same `cword` for every
+        completion.
+        '''
+        import re
+        compiled_cword, patterns = self._compiled
+        if compiled_cword == cword:
+            return patterns
+        cword_lower = cword.lower()
+        if not cword_lower:
+            # Every completion starts with the empty string. The newline at
+            # the end of the text does not start a completion.
+            pattern = re.compile('\n(?!\\Z)')
+            patterns = (pattern, pattern)
+            self._compiled = (cword, patterns)
+            return patterns
+        # The segment prefixes are matched after the newline before the
+        # candidate, and the subsequence anywhere in it. Both patterns start
+        # with a literal, which the regular expression engine can search for
+        # quickly. The subsequence matches the next occurrence of each
+        # character with a negated character class, which unlike `.*?` does
+        # not backtrack to try the later occurrences.
+        segments = '\n' + '[^{}\n]*{}'.format(
+            re.escape(self.sep), re.escape(self.sep)).join(
+                re.escape(segment) for segment in cword_lower.split(self.sep))
+        subsequence = '({})'.format(re.escape(cword_lower[0])) + ''.join(
+            '[^{0}\n]*({0})'.format(re.escape(char))
+            for char in cword_lower[1:])
+        patterns = (re.compile(segments), re.compile(subsequence))
+        self._compiled = (cword, patterns)
+        return patterns
+
+
+def _subsequence_points(text, match):
+    '''
+    Scores a subsequence `match` in `text`, by the number of matched characters
+    that start a word (worth 2 points) or follow the previous matched character
+    (worth 1 point). Each line of `text` must start with a newline.
+    '''
+    points = 0
+    previous = None
+    for group in range(1, match.lastindex + 1):
+        position = match.start(group)
+        if not text[position - 1].isalnum():
+            points += 2
+        elif position == previous:
+            points += 1
+        previous = position + 1
+    return points
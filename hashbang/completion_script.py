@@ -0,0 +1,579 @@
+'''
+Generates static shell completion scripts for hashbang commands.
+
+Completion through argcomplete starts a Python interpreter and imports the
+script on every TAB press. For most commands the possible completions are known
+ahead of time, so instead this walks the command tree once (following the
+tables created by `subcommands`) and emits a completion script for bash, zsh or
+fish containing the flags, aliases, choices and help messages. Only arguments
+with a dynamic `completer` call back into Python, using the same protocol as
+argcomplete.
+
+```sh
+eval "$(hashbang-completion generate my-awesome-script --shell bash)"
+```
+'''
+
+import argparse
+import importlib.util
+import os
+import re
+import sys
+
+from collections import OrderedDict
+from hashbang import command, subcommands, Argument
+from hashbang.hashbang import _DelegatingHashbangCommand, _resolve_subcommand
+from hashbang import _profile
+
+__all__ = [
+    'generate_completion_script',
+]
+
+SHELLS = ('bash', 'zsh', 'fish')
+
+
+class _Option:
+
+    def __init__(self, names, takes_value, choices, help, dynamic):
+        self.names = names
+        self.takes_value = takes_value
+        self.choices = choices
+        self.help = help
+        self.dynamic = dynamic
+
+
+class _Positional:
+
+    def __init__(self, choices, help, dynamic, repeat, descriptions=None):
+        self.choices = choices
+        self.help = help
+        self.dynamic = dynamic
+        # Whether this positional takes all remaining words
+        self.repeat = repeat
+        # Descriptions of each choice, used for subcommands
+        self.descriptions = descriptions or {}
+
+
+class _Node:
+    '''
+    A command in the command tree. `path` is the sequence of subcommand names
+    leading to this command.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.options = []
+        self.positionals = []
+        self.children = OrderedDict()
+
+    def walk(self):
+        yield self
+        for child in self.children.values():
+            yield from child.walk()
+
+
+def _summary(cmd):
+    doc = (cmd.func.__doc__ or '').strip()
+    return doc.split('\n', 1)[0].strip() if doc else None
+
+
+def _help(action):
+    if action.help is None or action.help == argparse.SUPPRESS:
+        return None
+    return ' '.join(action.help.split())
+
+
+def _describe(cmd, path=()):
+    '''
+    Creates the `_Node` tree for `cmd` by inspecting the parser it creates.
+    '''
+    node = _Node(path)
+    delegator = isinstance(cmd, _DelegatingHashbangCommand)
+    parser = cmd._create_parser(None, delegation=delegator)
+    # A completer on the function itself handles all completions dynamically
+    func_completer = getattr(cmd.func, 'completer', None) is not None
+    table = cmd.subcommands if delegator else None
+
+    node.options.append(_Option(
+        ['-h', '--help'], False, None, 'show this help message and exit',
+        False))
+    for action in parser._actions:
+        if action.dest == _profile.DEST:
+            continue
+        _, argument = cmd.arguments.get(action.dest, (None, None))
+        dynamic = func_completer or (
+            argument is not None and argument.completer is not None)
+        choices = ([str(c) for c in action.choices]
+                   if action.choices is not None else None)
+        if action.option_strings:
+            node.options.append(_Option(
+                list(action.option_strings), action.nargs != 0, choices,
+                _help(action), dynamic))
+        elif table is not None and not node.positionals:
+            descriptions = {}
+            for name, subcommand in table.items():
+                subcommand = _resolve_subcommand(subcommand)
+                child = _describe(subcommand._hashbang_command,
+                                  path + (name,))
+                node.children[name] = child
+                descriptions[name] = _summary(subcommand._hashbang_command)
+            node.positionals.append(_Positional(
+                list(table.keys()), _help(action), False, False,
+                descriptions))
+        else:
+            node.positionals.append(_Positional(
+                choices, _help(action), dynamic,
+                action.nargs in ('*', '+', argparse.REMAINDER)))
+    if delegator and table is None:
+        # The delegation of custom delegators is not known statically, so the
+        # remaining words are completed by calling the script
+        node.positionals.append(_Positional(None, None, True, True))
+    return node
+
+
+def _load_command(script, name=None):
+    '''
+    Imports the script as a module, without running its `__main__` block, and
+    returns the `HashbangCommand` named `name`. If `name` is not given, the
+    command named `main` is used, or the last command defined in the script.
+    '''
+    script = os.path.abspath(script)
+    sys.path.insert(0, os.path.dirname(script))
+    module_name = os.path.splitext(os.path.basename(script))[0]
+    spec = importlib.util.spec_from_file_location(module_name, script)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+
+    commands = OrderedDict(
+        (key, value._hashbang_command) for key, value in vars(module).items()
+        if hasattr(value, '_hashbang_command'))
+    if name is not None:
+        if name not in commands:
+            raise RuntimeError('Command "{}" not found in {}'.format(
+                name, script))
+        return commands[name]
+    if 'main' in commands:
+        return commands['main']
+    if not commands:
+        raise RuntimeError('No hashbang command found in {}'.format(script))
+    return list(commands.values())[-1]
+
+
+def _path_key(path):
+    return ' '.join(path)
+
+
+def _positional_conditions(node):
+    '''
+    Yields `(position, repeat, positional)` for each positional argument of
+    `node`, where position is the index of the positional word.
+    '''
+    for index, positional in enumerate(node.positionals):
+        yield index, positional.repeat, positional
+        if positional.repeat:
+            break
+
+
+def _value_taking_options(nodes):
+    return [(node, name) for node in nodes for option in node.options
+            if option.takes_value for name in option.names]
+
+
+def _sh_quote(value):
+    return "'" + value.replace("'", "'\\''") + "'"
+
+
+def _bash(prog, tree):
+    fn = '_hashbang_' + re.sub(r'\W', '_', prog)
+    nodes = list(tree.walk())
+    lines = [
+        '# bash completion for {}, generated by hashbang-completion'.format(
+            prog),
+        '{}_python() {{'.format(fn),
+        '    local IFS=$\'\\013\'',
+        '    COMPREPLY=($(_ARGCOMPLETE=1 _ARGCOMPLETE_IFS=$\'\\013\' '
+        '_COMPLETE_TO_STDOUT=1 \\',
+        '        COMP_LINE="$COMP_LINE" COMP_POINT="$COMP_POINT" '
+        '"${COMP_WORDS[0]}" 2>/dev/null))',
+        '}',
+        '',
+        '{}() {{'.format(fn),
+        '    local cur=${COMP_WORDS[COMP_CWORD]} cmdpath= opt= pos=0 word i',
+        '    for ((i = 1; i < COMP_CWORD; i++)); do',
+        '        word=${COMP_WORDS[i]}',
+        '        if [[ -n $opt ]]; then opt=; continue; fi',
+        '        if [[ $word == -* ]]; then',
+        '            case "$cmdpath $word" in',
+    ]
+    options = _value_taking_options(nodes)
+    if options:
+        lines.append('                {}) opt=$word ;;'.format('|'.join(
+            _sh_quote(_path_key(node.path) + ' ' + name)
+            for node, name in options)))
+    lines += [
+        '            esac',
+        '            continue',
+        '        fi',
+        '        case "$cmdpath $pos $word" in',
+    ]
+    for node in nodes:
+        for name in node.children:
+            lines.append('            {}) cmdpath={}; pos=0; continue ;;'
+                         .format(
+                _sh_quote('{} 0 {}'.format(_path_key(node.path), name)),
+                _sh_quote(_path_key(node.path + (name,)))))
+    lines += [
+        '        esac',
+        '        pos=$((pos + 1))',
+        '    done',
+        '',
+        '    if [[ -n $opt ]]; then',
+        '        case "$cmdpath $opt" in',
+    ]
+    for node in nodes:
+        for option in node.options:
+            if not option.takes_value:
+                continue
+            if option.dynamic:
+                action = '{}_python'.format(fn)
+            elif option.choices is not None:
+                action = 'COMPREPLY=($(compgen -W {} -- "$cur"))'.format(
+                    _sh_quote(' '.join(option.choices)))
+            else:
+                continue
+            lines.append('            {}) {} ;;'.format('|'.join(
+                _sh_quote(_path_key(node.path) + ' ' + name)
+                for name in option.names), action))
+    lines += [
+        '        esac',
+        '        return',
+        '    fi',
+        '    if [[ $cur == -* ]]; then',
+        '        case "$cmdpath" in',
+    ]
+    for node in nodes:
+        lines.append('            {}) COMPREPLY=($(compgen -W {} -- "$cur"))'
+                     ' ;;'.format(
+                         _sh_quote(_path_key(node.path)),
+                         _sh_quote(' '.join(name for option in node.options
+                                            for name in option.names))))
+    lines += [
+        '        esac',
+        '        return',
+        '    fi',
+        '    case "$cmdpath" in',
+    ]
+    for node in nodes:
+        branches = []
+        for index, repeat, positional in _positional_conditions(node):
+            if positional.dynamic:
+                action = '{}_python'.format(fn)
+            elif positional.choices is not None:
+                action = 'COMPREPLY=($(compgen -W {} -- "$cur"))'.format(
+                    _sh_quote(' '.join(positional.choices)))
+            else:
+                continue
+            branches.append('((pos {} {})); then {}'.format(
+                '>=' if repeat else '==', index, action))
+        if branches:
+            lines.append('        {})'.format(_sh_quote(_path_key(node.path))))
+            lines.append('            if ' + '\n            elif '.join(
+                branches) + '\n            fi ;;')
+    lines += [
+        '    esac',
+        '}',
+        'complete -o default -F {} {}'.format(fn, _sh_quote(prog)),
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def _zsh_describe(words, descriptions):
+    items = []
+    for word in words:
+        word = word.replace(':', '\\:')
+        description = descriptions.get(word)
+        items.append(_sh_quote(
+            word + (':' + description if description else '')))
+    return '(' + ' '.join(items) + ')'
+
+
+def _zsh(prog, tree):
+    fn = '_hashbang_' + re.sub(r'\W', '_', prog)
+    nodes = list(tree.walk())
+    lines = [
+        '#compdef {}'.format(prog),
+        '# zsh completion for {}, generated by hashbang-completion'.format(
+            prog),
+        '{}_python() {{'.format(fn),
+        '    local -a completions',
+        '    completions=(${(ps:\\013:)"$(_ARGCOMPLETE=1 '
+        '_ARGCOMPLETE_IFS=$\'\\013\' _COMPLETE_TO_STDOUT=1 \\',
+        '        COMP_LINE="$BUFFER" COMP_POINT="$CURSOR" '
+        '"${words[1]}" 2>/dev/null)"})',
+        '    compadd -Q -- "${completions[@]}"',
+        '}',
+        '',
+        '{}() {{'.format(fn),
+        '    local cmdpath= opt= pos=0 word i',
+        '    local -a candidates',
+        '    for ((i = 2; i < CURRENT; i++)); do',
+        '        word=${words[i]}',
+        '        if [[ -n $opt ]]; then opt=; continue; fi',
+        '        if [[ $word == -* ]]; then',
+        '            case "$cmdpath $word" in',
+    ]
+    options = _value_taking_options(nodes)
+    if options:
+        lines.append('                ({}) opt=$word ;;'.format('|'.join(
+            _sh_quote(_path_key(node.path) + ' ' + name)
+            for node, name in options)))
+    lines += [
+        '            esac',
+        '            continue',
+        '        fi',
+        '        case "$cmdpath $pos $word" in',
+    ]
+    for node in nodes:
+        for name in node.children:
+            lines.append(
+                '            ({}) cmdpath={}; pos=0; continue ;;'.format(
+                    _sh_quote('{} 0 {}'.format(_path_key(node.path), name)),
+                    _sh_quote(_path_key(node.path + (name,)))))
+    lines += [
+        '        esac',
+        '        pos=$((pos + 1))',
+        '    done',
+        '',
+        '    if [[ -n $opt ]]; then',
+        '        case "$cmdpath $opt" in',
+    ]
+    for node in nodes:
+        for option in node.options:
+            if not option.takes_value:
+                continue
+            if option.dynamic:
+                action = '{}_python'.format(fn)
+            elif option.choices is not None:
+                action = ('candidates={}; _describe -t values value '
+                          'candidates'.format(
+                              _zsh_describe(option.choices, {})))
+            else:
+                action = '_files'
+            lines.append('            ({}) {} ;;'.format('|'.join(
+                _sh_quote(_path_key(node.path) + ' ' + name)
+                for name in option.names), action))
+    lines += [
+        '            (*) _files ;;',
+        '        esac',
+        '        return',
+        '    fi',
+        '    if [[ ${words[CURRENT]} == -* ]]; then',
+        '        case "$cmdpath" in',
+    ]
+    for node in nodes:
+        names, descriptions = [], {}
+        for option in node.options:
+            for name in option.names:
+                names.append(name)
+                descriptions[name] = option.help
+        lines.append('            ({}) candidates={} ;;'.format(
+            _sh_quote(_path_key(node.path)),
+            _zsh_describe(names, descriptions)))
+    lines += [
+        '        esac',
+        '        _describe -t options option candidates',
+        '        return',
+        '    fi',
+        '    case "$cmdpath" in',
+    ]
+    for node in nodes:
+        branches = []
+        for index, repeat, positional in _positional_conditions(node):
+            if positional.dynamic:
+                action = '{}_python'.format(fn)
+            elif positional.choices is not None:
+                action = ('candidates={}; _describe -t values {} '
+                          'candidates'.format(
+                              _zsh_describe(positional.choices,
+                                            positional.descriptions),
+                              'command' if node.children else 'value'))
+            else:
+                action = '_files'
+            branches.append('((pos {} {})); then {}'.format(
+                '>=' if repeat else '==', index, action))
+        lines.append('        ({})'.format(_sh_quote(_path_key(node.path))))
+        if branches:
+            lines.append('            if ' + '\n            elif '.join(
+                branches))
+            lines.append('            else _files')
+            lines.append('            fi ;;')
+        else:
+            lines.append('            _files ;;')
+    lines += [
+        '    esac',
+        '}',
+        'compdef {} {}'.format(fn, _sh_quote(prog)),
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def _fish_quote(value):
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+def _fish_path(path):
+    # Paths are prefixed with ':' so that the root command is not an empty
+    # line, which fish would drop from a command substitution
+    return ':' + _path_key(path)
+
+
+def _fish(prog, tree):
+    fn = '__hashbang_' + re.sub(r'\W', '_', prog)
+    nodes = list(tree.walk())
+    value_options = _value_taking_options(nodes)
+    lines = [
+        '# fish completion for {}, generated by hashbang-completion'.format(
+            prog),
+        'function {}_state'.format(fn),
+        '    set -l cmdpath :',
+        '    set -l opt _',
+        '    set -l pos 0',
+        '    for word in (commandline -opc)[2..-1]',
+        '        if test $opt != _',
+        '            set opt _',
+        '            continue',
+        '        end',
+        '        if string match -q -- \'-*\' $word',
+        '            switch "$cmdpath $word"',
+    ]
+    if value_options:
+        lines += [
+            '                case ' + ' '.join(
+                _fish_quote(_fish_path(node.path) + ' ' + name)
+                for node, name in value_options),
+            '                    set opt $word',
+        ]
+    lines += [
+        '            end',
+        '            continue',
+        '        end',
+        '        switch "$cmdpath $pos $word"',
+    ]
+    for node in nodes:
+        for name in node.children:
+            lines += [
+                '            case {}'.format(_fish_quote('{} 0 {}'.format(
+                    _fish_path(node.path), name))),
+                '                set cmdpath {}'.format(
+                    _fish_quote(_fish_path(node.path + (name,)))),
+                '                set pos 0',
+                '                continue',
+            ]
+    lines += [
+        '        end',
+        '        set pos (math $pos + 1)',
+        '    end',
+        '    printf \'%s\\n\' $cmdpath $opt $pos',
+        'end',
+        '',
+        '# Usage: {}_at PATH [POSITION[+]]'.format(fn),
+        'function {}_at'.format(fn),
+        '    set -l state ({}_state)'.format(fn),
+        '    test "$state[1]" = "$argv[1]"; or return 1',
+        '    set -q argv[2]; or return 0',
+        '    test "$state[2]" = _; or return 1',
+        '    if string match -q -- \'*+\' $argv[2]',
+        '        test $state[3] -ge (string trim -r -c + -- $argv[2])',
+        '    else',
+        '        test $state[3] -eq $argv[2]',
+        '    end',
+        'end',
+        '',
+        'function {}_python'.format(fn),
+        '    set -l line (commandline -cp)',
+        '    env _ARGCOMPLETE=1 _ARGCOMPLETE_IFS=\\v _COMPLETE_TO_STDOUT=1 '
+        'COMP_LINE="$line" \\',
+        '        COMP_POINT=(string length -- "$line") '
+        '(commandline -opc)[1] 2>/dev/null | string split \\v',
+        'end',
+        '',
+    ]
+    for node in nodes:
+        condition = '{}_at {}'.format(fn, _fish_path(node.path))
+        for option in node.options:
+            args = ['complete', '-c', prog, '-n', _fish_quote(condition)]
+            for name in option.names:
+                if name.startswith('--'):
+                    args += ['-l', name[2:]]
+                elif len(name) == 2:
+                    args += ['-s', name[1:]]
+                else:
+                    args += ['-o', name[1:]]
+            if option.takes_value:
+                args.append('-r')
+                if option.dynamic:
+                    args += ['-f', '-a', _fish_quote('({}_python)'.format(fn))]
+                elif option.choices is not None:
+                    args += ['-f', '-a', _fish_quote(' '.join(
+                        option.choices))]
+            if option.help:
+                args += ['-d', _fish_quote(option.help)]
+            lines.append(' '.join(args))
+        for index, repeat, positional in _positional_conditions(node):
+            condition = '{}_at {} {}{}'.format(
+                fn, _fish_path(node.path), index, '+' if repeat else '')
+            base = ['complete', '-c', prog, '-n', _fish_quote(condition)]
+            if positional.dynamic:
+                lines.append(' '.join(base + [
+                    '-f', '-a', _fish_quote('({}_python)'.format(fn))]))
+            elif positional.choices is not None:
+                for choice in positional.choices:
+                    description = (positional.descriptions.get(choice) or
+                                   positional.help)
+                    lines.append(' '.join(
+                        base + ['-f', '-a', _fish_quote(choice)] +
+                        (['-d', _fish_quote(description)]
+                         if description else [])))
+    return '\n'.join(lines) + '\n'
+
+
+_GENERATORS = {
+    'bash': _bash,
+    'zsh': _zsh,
+    'fish': _fish,
+}
+
+
+def generate_completion_script(cmd, prog, shell='bash'):
+    '''
+    Returns the completion script for the `HashbangCommand` `cmd`, for the
+    command named `prog` in the given `shell`, which is one of "bash", "zsh" or
+    "fish".
+    '''
+    if shell not in _GENERATORS:
+        raise RuntimeError('Unsupported shell "{}"'.format(shell))
+    return _GENERATORS[shell](prog, _describe(cmd))
+
+
+@command(
+    Argument('shell', choices=SHELLS, help='The shell to generate for'),
+    Argument('command', help='The name of the command in the script. '
+                             'Defaults to "main", or the last command defined '
+                             'in the script'),
+    Argument('prog', help='The name the command is invoked with. Defaults to '
+                          'the file name of the script'))
+def generate(script, *, shell='bash', command=None, prog=None):
+    '''
+    Generate a static completion script for a hashbang script.
+    '''
+    cmd = _load_command(script, command)
+    return generate_completion_script(
+        cmd, prog or os.path.basename(script), shell).rstrip('\n')
+
+
+main = subcommands(generate=generate)
+
+
+if __name__ == '__main__':
+    main.execute()
@@ -0,0 +1,334 @@
+'''
+Reads the default values of the arguments of a command from configuration
+files.
+'''
+
+import os
+
+from ._utils import cache_dir
+
+__all__ = ['ConfigFile']
+
+# Parsed files at least this large are cached on disk. Smaller files are
+# faster to parse than to load from the cache.
+_CACHE_MIN_BYTES = 64 * 1024
+_CACHE_VERSION = 1
+# Files already parsed in this process, keyed by path. The values are
+# ((mtime_ns, size), data).
+_parsed = {}
+_BOOLEANS = {
+    '1': True, 'yes': True, 'true': True, 'on': True,
+    '0': False, 'no': False, 'false': False, 'off': False,
+}
+
+
+class ConfigFile:
+    '''
+    An extension that sets the default values of the arguments of a command
+    from configuration files, so that they can still be overridden on the
+    command line.
+
+    ```python3
+    @command(ConfigFile('/usr/share/grep/defaults.ini', name='grep.toml'))
+    def grep(pattern, *files, after: Argument(type=int) = 0, color=False):
+        ...
+    ```
+
+    The files are read in the following order, each overriding the values in
+    the ones before it. Files that do not exist are skipped.
+    1.  `paths`, in the order given.
+    2.  If `name` is given, the system file `/etc/<name>`, the user file
+        `$XDG_CONFIG_HOME/<name>` (or `~/.config/<name>`), and the project
+        file `<name>` in the current directory or the nearest of its parents.
+
+    The format of each file is determined by its extension:
+    -   `.json` - A JSON object.
+    -   `.toml` - A TOML document. This requires Python 3.11 (`tomllib`), or
+        the `tomli` package.
+    -   Anything else - An INI file as read by `configparser`. Keys before the
+        first section header apply to all sections, so a list of `key=value`
+        lines also works.
+
+    The values at the top level of a file apply to the command, and are
+    overridden by the values in the section (a JSON object or TOML table) for
+    the command, which is named after the function unless `section` is given.
+    A `section` with dots (e.g. `tool.grep`) refers to nested tables in JSON
+    and TOML. Keys are matched to the parameter names, with `-` read as `_`,
+    and keys that do not match any parameter are ignored so that config
+    files can be shared between commands.
+
+    Values are converted like the command line arguments: strings are passed
+    through the `type` of the `Argument` (or the type derived from the
+    annotation of the parameter), the items of lists (for `append` arguments
+    and `*args`, where a single value is read as a list of one) are converted
+    one by one, and boolean flags accept `true` / `false`, `yes` / `no`, `on`
+    / `off` and `1` / `0`. Values that are not strings, e.g. numbers in JSON,
+    are used as they are.
+
+    The list of an `append` argument is used when the argument is not given
+    on the command line. Otherwise the values given on the command line
+    replace it, instead of being appended to it.
+
+    Files larger than 64 KiB are parsed once and cached in
+    `$XDG_CACHE_HOME/hashbang/config`, until their modification time or size
+    changes, so that large shared config files are not parsed again on every
+    run.
+
+    ```python3
+    ConfigFile(*paths, name=None, section=None)
+    ```
+    '''
+
+    def __init__(self, *paths, name=None, section=None):
+        self.paths = paths
+        self.name = name
+        self.section = section
+
+    def apply_hashbang_extension(self, cmd):
+        params = {}
+        for param_name in cmd.signature.parameters:
+            params[param_name.rstrip('_')] = param_name
+            params[param_name] = param_name
+        section = self.section or cmd.func.__name__
+        # The values of `append` arguments, which are not set as argparse
+        # defaults since argparse would append the given values to them
+        # (https://bugs.python.org/issue16399)
+        appended = {}
+        for path in self.layers():
+            data = _load(path)
+            if data is None:
+                continue
+            for key, value in _select(data, section).items():
+                param_name = params.get(key.replace('-', '_'))
+                if param_name is None:
+                    continue
+                value = self._convert(
+                    cmd, param_name, value, '{} in {}'.format(key, path))
+                if _argument(cmd, param_name)[1].append:
+                    appended[param_name] = value
+                else:
+                    cmd.default_values[param_name] = value
+        if appended:
+            invoker = cmd.invoker
+
+            def config_invoker(func, args, kwargs, opts):
+                for param_name, value in appended.items():
+                    if not kwargs.get(param_name):
+                        kwargs[param_name] = list(value)
+                return invoker(func, args, kwargs, opts)
+            cmd.invoker = config_invoker
+
+    def layers(self):
+        '''
+        Returns the paths of the files to read, in order of increasing
+        precedence.
+        '''
+        paths = [os.path.expanduser(str(path)) for path in self.paths]
+        if self.name is not None:
+            config_home = (os.environ.get('XDG_CONFIG_HOME') or
+                           os.path.join(os.path.expanduser('~'), '.config'))
+            paths.append(os.path.join('/etc', self.name))
+            paths.append(os.path.join(config_home, self.name))
+            project = _find_upwards(os.getcwd(), self.name)
+            if project is not None:
+                paths.append(project)
+        return paths
+
+    @staticmethod
+    def _convert(cmd, param_name, value, where):
+        import argparse
+        param, argument = _argument(cmd, param_name)
+        if type(param.default) is bool:
+            if isinstance(value, str):
+                if value.lower() not in _BOOLEANS:
+                    raise RuntimeError(
+                        'Invalid boolean value {!r} for {}'
+                        .format(value, where))
+                return _BOOLEANS[value.lower()]
+            return value
+        from inspect import Parameter
+        if ((argument.append or param.kind is Parameter.VAR_POSITIONAL) and
+                not isinstance(value, list)):
+            value = [value]
+        from . import _convert
+        convert = _convert.argument_type(argument, param)
+        if convert is None or not isinstance(value, list):
+            # Strings are converted by argparse, like the other defaults
+            return value
+        try:
+            return [convert(item) if isinstance(item, str) else item
+                    for item in value]
+        except (TypeError, ValueError, argparse.ArgumentTypeError) as e:
+            raise RuntimeError(
+                'Invalid value {!r} for {}: {}'.format(value, where, e))
+
+
+def _argument(cmd, param_name):
+    '''
+    Returns `(param, argument)` for the parameter, taking into account the
+    `Argument`s in the extensions which may not have been applied yet.
+    '''
+    from .hashbang import Argument
+    param, argument = cmd.arguments.get(
+        param_name, (cmd.signature.parameters[param_name], Argument()))
+    for extension in cmd.extensions:
+        if (isinstance(extension, Argument) and
+                extension.name == param_name):
+            argument = extension
+    return param, argument
+
+
+def _find_upwards(directory, name):
+    while True:
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            return path
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def _select(data, section):
+    '''
+    Returns the top level values of `data`, overridden by the values in
+    `section`.
+    '''
+    if not isinstance(data, dict):
+        return {}
+    values = {key: value for key, value in data.items()
+              if not isinstance(value, dict)}
+    table = data.get(section)
+    if table is None:
+        # Nested tables in JSON and TOML, e.g. tool.grep
+        table = data
+        for part in section.split('.'):
+            table = table.get(part) if isinstance(table, dict) else None
+    if isinstance(table, dict):
+        values.update(
+            (key, value) for key, value in table.items()
+            if not isinstance(value, dict))
+    return values
+
+
+def _load(path):
+    '''
+    Returns the parsed contents of the config file at `path` as a dict, or
+    `None` if it does not exist. INI files are returned as a dict of the
+    top-level values and a dict for each section.
+    '''
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    path = os.path.abspath(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    parsed = _parsed.get(path)
+    if parsed is not None and parsed[0] == version:
+        return parsed[1]
+    cache = None
+    if stat.st_size >= _CACHE_MIN_BYTES:
+        cache = _DiskCache(path, version)
+        data = cache.load()
+        if data is not None:
+            _parsed[path] = (version, data)
+            return data
+    data = _parse(path)
+    _parsed[path] = (version, data)
+    if cache is not None:
+        cache.store(data)
+    return data
+
+
+def _parse(path):
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        if extension == '.json':
+            import json
+            with open(path, 'r') as f:
+                return json.load(f)
+        elif extension == '.toml':
+            toml = _import_toml()
+            with open(path, 'rb') as f:
+                return toml.load(f)
+        else:
+            with open(path, 'r') as f:
+                return _parse_ini(f.read())
+    except ValueError as e:
+        # The decode errors of json, tomllib and configparser are ValueErrors
+        raise RuntimeError('Cannot parse config file {}: {}'.format(path, e))
+
+
+def _import_toml():
+    try:
+        import tomllib
+        return tomllib
+    except ImportError:
+        pass
+    try:
+        import tomli
+        return tomli
+    except ImportError:
+        raise RuntimeError(
+            'Reading TOML config files requires Python 3.11 or above, or the '
+            '"tomli" package')
+
+
+def _parse_ini(text):
+    import configparser
+    # Keys before the first section header are put in the default section,
+    # whose values configparser makes visible in every section
+    top = 'hashbang:top'
+    parser = configparser.ConfigParser(
+        default_section=top, interpolation=None, strict=False)
+    parser.optionxform = str
+    try:
+        parser.read_string('[{}]\n{}'.format(top, text))
+    except configparser.Error as e:
+        raise ValueError(str(e))
+    data = dict(parser.defaults())
+    for name in parser.sections():
+        data[name] = {key: value for key, value in parser.items(name)}
+    return data
+
+
+class _DiskCache:
+    '''
+    The parsed contents of a config file, stored in
+    `$XDG_CACHE_HOME/hashbang/config` along with the modification time and
+    size of the file they were parsed from.
+    '''
+
+    def __init__(self, path, version):
+        import zlib
+        self.path = path
+        self.version = version
+        self.cache_path = cache_dir('config', '{:08x}.pickle'.format(
+            zlib.crc32(path.encode())))
+
+    def load(self):
+        import pickle
+        try:
+            with open(self.cache_path, 'rb') as f:
+                key, data = pickle.load(f)
+        except Exception:
+            return None
+        if key != (_CACHE_VERSION, self.path, self.version):
+            return None
+        return data
+
+    def store(self, data):
+        import pickle
+        try:
+            pickled = pickle.dumps(
+                ((_CACHE_VERSION, self.path, self.version), data))
+        except Exception:
+            return
+        tmp = '{}.{}.tmp'.format(self.cache_path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(pickled)
+            os.replace(tmp, self.cache_path)
+        except OSError:
+            pass
@@ -0,0 +1,418 @@
+'''
+Serves a hashbang command from a persistent daemon, to skip the interpreter
+startup and the imports of the script on every run.
+
+```python3
+from hashbang import command
+from hashbang.daemon import Daemon
+
+@command(Daemon())
+def main(arg):
+    ...
+```
+
+Daemon mode can also be turned on for every hashbang script by setting the
+environment variable `HASHBANG_DAEMON=1`. It is only supported on platforms
+with `fork()` and Unix sockets.
+
+The first run of the script executes normally, but before doing so forks a
+daemon which keeps the script's module imported and listens on a Unix socket
+(in `$XDG_RUNTIME_DIR/hashbang`). The daemon keeps a few workers pre-forked,
+each of which handles a single request and then exits, so that every run
+starts from the same clean state.
+
+When hashbang is imported by a later run of the script and the daemon's socket
+exists, the command line arguments, working directory, environment variables
+and the stdin, stdout and stderr file descriptors are sent to the daemon
+instead, and the process exits with the exit code returned by the worker.
+SIGINT, SIGTERM and SIGHUP received while waiting are forwarded to the worker.
+If the daemon is not running, or if the script or hashbang was modified since
+the daemon started, the script runs normally (and starts a new daemon). Note
+that to skip importing the script, `hashbang` should be imported before the
+other (slower) imports of the script.
+'''
+
+import os
+import signal
+import sys
+
+from ._utils import daemon_socket, source_files
+
+__all__ = ['Daemon']
+
+_PROTOCOL_VERSION = 1
+# The first byte of the response from the worker
+_STALE = b'S'
+_EXIT = b'X'
+
+# Whether this process is a worker of a daemon, in which case the command must
+# be executed directly
+_worker = False
+
+
+class Daemon:
+    '''
+    An extension to serve the command from a persistent daemon. See the module
+    documentation for details.
+
+    -   `workers` - The number of workers that are forked ahead of time. This
+        is the number of requests that can be handled concurrently without
+        waiting for a fork.
+    -   `idle_timeout` - The number of seconds after the last request after
+        which the daemon exits.
+    '''
+
+    def __init__(self, *, workers=2, idle_timeout=600):
+        self.workers = workers
+        self.idle_timeout = idle_timeout
+
+    def apply_hashbang_extension(self, cmd):
+        # The daemon is started by start(), which is called from execute()
+        # before the parser is created
+        pass
+
+
+def start(cmd):
+    '''
+    Called when `cmd` is executed with the arguments from the command line.
+    Starts a daemon for the main script if daemon mode is enabled for `cmd`.
+    The caller continues to execute `cmd` normally.
+    '''
+    if _worker or not hasattr(os, 'fork') or '_ARGCOMPLETE' in os.environ:
+        return
+    options = next(
+        (e for e in cmd.extensions if isinstance(e, Daemon)), None)
+    if options is None:
+        if os.environ.get('HASHBANG_DAEMON') != '1':
+            return
+        options = Daemon()
+    script = _main_script()
+    if script is None:
+        return
+    _spawn(_Server(cmd, options, script))
+
+
+def _main_script():
+    return getattr(sys.modules.get('__main__'), '__file__', None)
+
+
+def _script_key(script):
+    '''
+    Identifies the version of the script, hashbang and Python the daemon is
+    running, so that the client can tell whether the daemon is stale.
+    '''
+    key = [sys.executable, sys.version]
+    for path in [script] + source_files():
+        stat = os.stat(path)
+        key += [stat.st_mtime_ns, stat.st_size]
+    return tuple(key)
+
+
+def _is_private(directory):
+    stat = os.stat(directory)
+    return stat.st_uid == os.getuid() and not stat.st_mode & 0o077
+
+
+def _recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError()
+        data += chunk
+    return data
+
+
+def _forward_main():
+    '''
+    Forwards the execution of the main script to its daemon and exits with the
+    returned exit code. Returns if the daemon cannot serve the request, in
+    which case the script should run normally.
+    '''
+    script = _main_script()
+    code = _forward(daemon_socket(script), script)
+    if code is not None:
+        sys.exit(code)
+
+
+def _forward(path, script):
+    import array
+    import marshal
+    import socket
+    try:
+        if not _is_private(os.path.dirname(path)):
+            return None
+        key = _script_key(script)
+    except OSError:
+        return None
+    request = marshal.dumps({
+        'version': _PROTOCOL_VERSION,
+        'key': key,
+        'argv': sys.argv,
+        'cwd': os.getcwd(),
+        'env': dict(os.environ),
+    })
+    data = len(request).to_bytes(4, 'little') + request
+    fds = array.array('i', (0, 1, 2))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        # The file descriptors are sent along with the first chunk
+        sent = sock.sendmsg(
+            [data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds.tobytes())])
+        sock.sendall(data[sent:])
+    except OSError:
+        sock.close()
+        return None
+
+    def forward_signal(signum, frame):
+        try:
+            sock.send(bytes((signum,)))
+        except OSError:
+            pass
+
+    handlers = {
+        signum: signal.signal(signum, forward_signal)
+        for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP)}
+    try:
+        response = _recv_exactly(sock, 1)
+        if response == _STALE:
+            return None
+        return int.from_bytes(
+            _recv_exactly(sock, 4), 'little', signed=True)
+    except (OSError, EOFError):
+        print('hashbang: Lost connection to the daemon', file=sys.stderr)
+        return 1
+    finally:
+        sock.close()
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+
+
+def _spawn(server):
+    '''
+    Forks the daemon process, and waits for it to start listening so that the
+    next run of the script can use it.
+    '''
+    ready_r, ready_w = os.pipe()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid:
+        os.close(ready_w)
+        os.read(ready_r, 1)
+        os.close(ready_r)
+        os.waitpid(pid, 0)
+        return
+    # The forked process must never return to the caller, which would run the
+    # command a second time
+    try:
+        os.close(ready_r)
+        os.setsid()
+        # Fork again so that the daemon is not a child of the client
+        if os.fork():
+            os._exit(0)
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        os.close(devnull)
+        server.bind()
+        os.write(ready_w, b'1')
+        os.close(ready_w)
+        server.serve()
+    finally:
+        os._exit(0)
+
+
+class _Server:
+
+    def __init__(self, cmd, options, script):
+        self.cmd = cmd
+        self.options = options
+        self.script = script
+        self.path = daemon_socket(script)
+        self.key = _script_key(script)
+        self.sock = None
+        self.inode = None
+
+    def bind(self):
+        import socket
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if not _is_private(directory):
+            raise RuntimeError(
+                'Directory {} must only be accessible by the current user'
+                .format(directory))
+        # Bind to a temporary path and rename it, which atomically replaces
+        # the socket of a stale daemon
+        tmp = '{}.{}'.format(self.path, os.getpid())
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(tmp)
+        os.chmod(tmp, 0o600)
+        self.sock.listen(64)
+        os.replace(tmp, self.path)
+        self.inode = os.stat(self.path).st_ino
+
+    def serve(self):
+        import select
+        import time
+        # Wake up from select() when a worker exits
+        wakeup_r, wakeup_w = os.pipe()
+        os.set_blocking(wakeup_w, False)
+        signal.set_wakeup_fd(wakeup_w)
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        workers = set()
+        last_request = time.monotonic()
+        try:
+            while not self._should_exit(last_request):
+                while len(workers) < self.options.workers:
+                    pid = os.fork()
+                    if pid == 0:
+                        try:
+                            os.close(wakeup_r)
+                            os.close(wakeup_w)
+                            self._handle_request()
+                        finally:
+                            os._exit(0)
+                    workers.add(pid)
+                if select.select([wakeup_r], [], [], 1)[0]:
+                    os.read(wakeup_r, 4096)
+                while workers:
+                    pid, _ = os.waitpid(-1, os.WNOHANG)
+                    if pid == 0:
+                        break
+                    workers.discard(pid)
+                    last_request = time.monotonic()
+        finally:
+            for pid in workers:
+                os.kill(pid, signal.SIGTERM)
+            self.sock.close()
+            try:
+                if os.stat(self.path).st_ino == self.inode:
+                    os.unlink(self.path)
+            except OSError:
+                pass
+
+    def _should_exit(self, last_request):
+        import time
+        if time.monotonic() - last_request > self.options.idle_timeout:
+            return True
+        try:
+            return (os.stat(self.path).st_ino != self.inode or
+                    _script_key(self.script) != self.key)
+        except OSError:
+            return True
+
+    def _handle_request(self):
+        global _worker
+        _worker = True
+        signal.set_wakeup_fd(-1)
+        for signum in (signal.SIGCHLD, signal.SIGTERM):
+            signal.signal(signum, signal.SIG_DFL)
+        conn, _ = self.sock.accept()
+        self.sock.close()
+        if not _is_same_user(conn):
+            return
+        request, fds = _receive(conn)
+        if (len(fds) != 3 or
+                request.get('version') != _PROTOCOL_VERSION or
+                request.get('key') != self.key):
+            conn.sendall(_STALE)
+            return
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        _reopen_stdio()
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        sys.argv = request['argv']
+        from . import _timing
+        _timing.configure(restart=True)
+        _receive_signals(conn)
+        code = _execute(self.cmd)
+        _timing.flush()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        conn.sendall(_EXIT + code.to_bytes(4, 'little', signed=True))
+
+
+def _is_same_user(conn):
+    import socket
+    if not hasattr(socket, 'SO_PEERCRED'):
+        # The socket is only accessible to the current user anyway
+        return True
+    import array
+    creds = array.array('i')
+    creds.frombytes(conn.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, 3 * creds.itemsize))
+    _, uid, _ = creds
+    return uid == os.getuid()
+
+
+def _receive(conn):
+    '''
+    Receives a request sent by `_forward`, returning the pair
+    `(request, fds)`.
+    '''
+    import array
+    import marshal
+    import socket
+    fds = array.array('i')
+    header, ancdata, _, _ = conn.recvmsg(
+        4, socket.CMSG_LEN(3 * fds.itemsize))
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - len(data) % fds.itemsize])
+    header += _recv_exactly(conn, 4 - len(header))
+    request = marshal.loads(
+        _recv_exactly(conn, int.from_bytes(header, 'little')))
+    return request, list(fds)
+
+
+def _reopen_stdio():
+    '''
+    Recreates `sys.stdin`, `sys.stdout` and `sys.stderr` for the file
+    descriptors received from the client, since the buffering of the streams
+    depends on whether they are terminals.
+    '''
+    for name, fd, mode in (('stdin', 0, 'r'),
+                           ('stdout', 1, 'w'),
+                           ('stderr', 2, 'w')):
+        stream = getattr(sys, name)
+        line_buffering = mode == 'w' and (name == 'stderr' or os.isatty(fd))
+        setattr(sys, name, open(
+            fd, mode, buffering=1 if line_buffering else -1,
+            encoding=stream.encoding, errors=stream.errors, closefd=False))
+
+
+def _receive_signals(conn):
+    '''
+    Raises the signals forwarded by the client in this process.
+    '''
+    import threading
+
+    def receive():
+        while True:
+            data = conn.recv(1)
+            if not data:
+                return
+            os.kill(os.getpid(), data[0])
+
+    threading.Thread(target=receive, daemon=True).start()
+
+
+def _execute(cmd):
+    '''
+    Executes `cmd` like the script would, returning the exit code.
+    '''
+    from .hashbang import _exit_code
+    try:
+        cmd.execute()
+    except SystemExit as e:
+        return _exit_code(e)
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        return 1
+    return 0
@@ -1,18 +1,15 @@
 import argparse
-import functools
 import inspect
 import os
 import re
-import subprocess
 import sys
-import traceback
 
 from collections import OrderedDict
 from contextlib import contextmanager
 from inspect import Parameter
-from itertools import chain, islice, repeat
-from pathlib import Path
 from ._utils import optionalarg
+from . import _profile
+from . import _timing
 from . import completion
 
 __all__ = [
@@ -23,13 +20,51 @@ __all__ = [
 ]
 
 
+# The kinds of parameters in HashbangCommand._args_plan
+_POSITIONAL = 'positional'
+_VAR_POSITIONAL = 'var_positional'
+_KEYWORD = 'keyword'
+_REMAINDER = 'remainder'
+# The attribute of the argparse namespace holding the arguments being parsed,
+# for actions which need all of them (e.g. --help)
+_ARGS_DEST = '_hashbang_args'
+# Async generators only exist on Python 3.6 and above
+_isasyncgen = getattr(inspect, 'isasyncgen', lambda value: False)
+
+
 class _CommandParser(argparse.ArgumentParser):
 
     parse_known = False
     delegation = False
+    has_help = False
+    # When not None, the actions created by add_argument are recorded to this
+    # list so they can be restored by the parser cache
+    spec = None
 
     def add_argument(self, *args, **kwargs):
-        return super().add_argument(*args, **kwargs)
+        action = super().add_argument(*args, **kwargs)
+        if self.spec is not None:
+            from . import _parsercache
+            self.spec.append(('argument', None, type(action),
+                              _parsercache.action_state(action)))
+        return action
+
+    def add_mutually_exclusive_group(self, **kwargs):
+        group = super().add_mutually_exclusive_group(**kwargs)
+        if self.spec is not None:
+            from . import _parsercache
+            spec = self.spec
+            index = len(spec)
+            spec.append(('mutually_exclusive_group', kwargs))
+            add_argument = group.add_argument
+
+            def _add_argument(*args, **kwargs):
+                action = add_argument(*args, **kwargs)
+                spec.append(('argument', index, type(action),
+                             _parsercache.action_state(action)))
+                return action
+            group.add_argument = _add_argument
+        return group
 
     def parse(self, args=None, namespace=None):
         if self.parse_known:
@@ -37,6 +72,23 @@ class _CommandParser(argparse.ArgumentParser):
         else:
             return (self.parse_args(args, namespace), ())
 
+    def _check_value(self, action, value):
+        if action.choices is None:
+            # This is called for every value, so skip the import below for
+            # arguments without choices
+            return
+        from ._choices import IndexedChoices
+        # Avoid listing every choice in the error message if there are many
+        if (isinstance(action.choices, IndexedChoices) and
+                value not in action.choices):
+            # The name of the argument is not taken from the action, which
+            # would be the truncated list of choices for positional arguments
+            raise argparse.ArgumentError(
+                None, 'argument {}: invalid choice: {!r} (choose from {})'
+                .format('/'.join(action.option_strings) or action.dest,
+                        value, action.choices.summary()))
+        super()._check_value(action, value)
+
     def error(self, message):
         if self.delegation:
             raise NoMatchingDelegate()
@@ -87,6 +139,13 @@ def command(func, extensions=(), **kwargs):
         will be assigned to the parameter. For example, `--foo bar` will set
         the value of `foo` to `bar`.
 
+    The decorated function can also be an `async def` function, in which case
+    it is run on an asyncio event loop (using uvloop if it is installed), or
+    an async generator, in which case each of the generated values are passed
+    to the return value processor as soon as they are generated. On Ctrl-C,
+    the running tasks are cancelled before the `KeyboardInterrupt` is passed
+    to the exception handler.
+
     ```python3
     <main>.execute(args=None)
     ```
@@ -96,12 +155,30 @@ def command(func, extensions=(), **kwargs):
     with the given command line arguments in `args`, or in `sys.argv` if `args`
     is `None`.
 
+    ```python3
+    <main>.execute_many(argvs, workers=None)
+    ```
+
+    Executes the decorated function once for each list of command line
+    arguments in the iterable `argvs`, reusing the same parser. Unlike
+    `execute`, this never calls `sys.exit`, and is a generator yielding a pair
+    `(result, exit_code)` for each call, in the same order as `argvs`. `result`
+    is the return value of the function if the call succeeded, or the
+    exception raised by it otherwise. The return value processor and exception
+    handler are called just like in `execute`. If `workers` is given, the calls
+    are run in a thread pool of that size, in which case the function must be
+    thread-safe. The parser is prepared once before the calls start, and is
+    only read by the threads. Delegators execute their delegates with
+    `execute`, which is not thread-safe, so `workers` should not be used with
+    delegators.
+
     ### API
 
     ```python3
     @command(*extensions,
              prog=None, formatter_class=None, allow_abbrev=True,
-             return_value_processor=None, exception_handler=None)
+             return_value_processor=None, exception_handler=None,
+             parser_cache=None)
     ```
 
     #### Keyword arguments parsed to `argparse.ArgumentParser()`
@@ -122,13 +199,11 @@ def command(func, extensions=(), **kwargs):
     -   `return_value_processor` - A callable that takes the return value of
         the decorated function and processes it. When this is `None`, the
         default implementation is used, which is to `print()` the result to
-        stdout.
-
-    ```python3
-    def _default_return_value_processor(val):
-        if val is not None:
-            print(val)
-    ```
+        stdout. If the result is an iterator, e.g. a generator or a `map` or
+        `zip` object, each item is written on its own line as soon as it is
+        produced instead. Files are printed like any other value. If stdout is
+        closed by the reader, e.g. in `command.py | head`, the iteration stops
+        quietly.
 
     -   `exception_handler` - A callable that takes the exception raised by the
         decorated function and processes it. This method should re-raise any
@@ -150,6 +225,19 @@ def command(func, extensions=(), **kwargs):
             print('^C', file=sys.stderr)
     ```
 
+    -   `parser_cache` - Whether to cache the argument spec resolved from the
+        function signature and the `Argument`s on disk, so that subsequent runs
+        rebuild the parser from the recorded spec instead of inspecting the
+        function again. When this is `True`, the cache is stored in
+        `$XDG_CACHE_HOME/hashbang`. This can also be a directory path, for
+        example to store the cache next to the script. The cache is keyed by
+        the modification times and sizes of the script and of hashbang, so it
+        is not updated when other modules imported by the script change. It
+        is only used for commands whose extensions are all `Argument`s.
+        Loading the cache has a small fixed cost, so this pays off for
+        commands with many arguments (see `benchmarks/parser_cache.py`).
+        Default is `None` (disabled).
+
     #### Using extensions
 
     `@command` can also optionally take extensions as positional arguments, and
@@ -168,6 +256,7 @@ def command(func, extensions=(), **kwargs):
     cmd = HashbangCommand(func, extensions, **kwargs)
     func._hashbang_command = cmd
     func.execute = cmd.execute
+    func.execute_many = cmd.execute_many
     return func
 
 
@@ -191,12 +280,17 @@ def _commanddelegator(func, extensions=(), **kwargs):
     cmd = _DelegatingHashbangCommand(func, extensions, **kwargs)
     func._hashbang_command = cmd
     func.execute = cmd.execute
+    func.execute_many = cmd.execute_many
     return func
 
 
 command.delegator = _commanddelegator
 
 
+def _parse_bool(value):
+    return value == 'True'
+
+
 class _StoreBooleanAction(argparse.Action):
     '''
     Same as argparse's store_const, but includes an extra "type" argument. This
@@ -219,7 +313,7 @@ class _StoreBooleanAction(argparse.Action):
             nargs=0,
             default=default,
             required=required,
-            type=lambda x: x == 'True',
+            type=_parse_bool,
             help=help)
 
     def __call__(self, parser, namespace, values, option_string=None):
@@ -274,9 +368,11 @@ class Argument:
     `Argument` configurations.
 
     ```python3
-    Argument(name=None, *, choices=None, completer=None, aliases=(),
-             append=False, help=None, type=None, required=False,
-             remainder=False)
+    Argument(name=None, *, choices=None, completer=None,
+             completion_cache_ttl=None, max_completions=None,
+             completion_timeout=None, aliases=(), append=False, help=None,
+             type=None, required=False, remainder=False, py_only=False,
+             stdin=False, chunk_size=None, container=None)
     ```
     -   `name` - The name of the argument. This is required when using
         `Argument` as a parameter to `@command`, and it must match the name of
@@ -285,7 +381,10 @@ class Argument:
         specified.
     -   `choices` - A sequence of strings that corresponds to the possible
         values of the argument. This is used in both the help message and in
-        tab completion.
+        tab completion. Large sets of choices (more than 100 strings) are
+        indexed, so that checking the value and completing a prefix do not
+        need to scan all of them, and only the first few choices are listed in
+        the help message.
     -   `completer` - A callable with the keyword arguments `prefix`, `action`,
         `parser`, and `parsed_args`. This callable should return a list of
         possible completion values. This is only used in tab-completion.
@@ -299,6 +398,23 @@ class Argument:
         -   `parsed_args`: The result of argument parsing so far (the
             `argparse.Namespace` args object normally returned by
             `ArgumentParser.parse_args()`).
+    -   `completion_cache_ttl` - The number of seconds to cache the results of
+        `completer` on disk (in `$XDG_CACHE_HOME/hashbang/completions`), for
+        completers that are too slow to run on every TAB press. Results are
+        cached separately for each working directory and values of the other
+        arguments, and are filtered by the typed prefix as usual. When the
+        cached results are older than this, they are still used while being
+        refreshed in the background, until they are older than 10 times this
+        duration. Default is `None` (not cached).
+    -   `max_completions` - The maximum number of completions to show. The
+        completer can return a generator, which stops being consumed once this
+        many completions passing `completion_validator` have been produced.
+        Default is `None` (unlimited).
+    -   `completion_timeout` - The number of seconds to wait for the
+        completer, e.g. `0.1`. When the time is up, the completions produced
+        so far are shown, so that a slow completer does not freeze the shell.
+        This is most useful with a completer that returns a generator. Default
+        is `None` (wait until the completer returns).
     -   `completion_validator` - A callable that takes
         `(current_input, keyword_to_check_against)` and returns a boolean
         indicating whether `keyword_to_check_against` should be part of the
@@ -321,7 +437,15 @@ class Argument:
         returns the converted value. A common usage is to use `int` or `float`
         to convert to the desired type. `argparse.FileType` can also be used
         here. This can also be used to validate the input, but raising an
-        exception if the input doesn't match expectations.
+        exception if the input doesn't match expectations. If `type` is not
+        given, it is derived from the annotation of the parameter, for the
+        annotations `int`, `float`, `complex`, `decimal.Decimal`,
+        `fractions.Fraction`, `pathlib.Path` (and the other `PurePath`
+        classes), `Enum` classes (by member name or value), `datetime`,
+        `date` and `time` (in ISO 8601 format), and `Optional[...]` of those.
+        Other annotations are ignored. For `*args` and `append` arguments, the
+        converted values of repeated strings are reused, except for the
+        cheap numeric types.
     -   `required` - Whether the argument is required. This is applicable only
         to optional arguments. For boolean flags, you will need to specify
         either `--flag` or `--noflag` in the command line. For other flags, you
@@ -334,6 +458,35 @@ class Argument:
     -   `py_only` - Boolean indicating whether this argument is for Python use
         only. If this is true, the argument will not be added to the command
         line parser.
+    -   `stdin` - Boolean indicating whether the function receives the lines
+        of stdin for this argument, Unix filter style. This is applicable only
+        to positional arguments (`def func(lines)`). On the command line, the
+        argument takes any number of file names, whose lines are read in
+        order, and `-` or no file names at all stand for stdin. The function
+        receives a lazy iterator over the lines, without the trailing newline,
+        so that a generator consuming it and yielding results processes
+        inputs of any size in constant memory.
+        ```python3
+        @command
+        def upper(lines: Argument(stdin=True)):
+            for line in lines:
+                yield line.upper()
+        ```
+    -   `chunk_size` - When `stdin` is true, pass the lines in lists of this
+        many lines (the last list may be shorter) instead of one by one.
+    -   `container` - `'array'` or `'ndarray'`, to pass all the numbers given
+        to a positional argument as a compact `array.array`, or as a NumPy
+        `ndarray` (which requires `numpy`), instead of a tuple of Python
+        numbers. The argument takes any number of values on the command line,
+        which are converted in a single pass. `type` (or the annotation) must
+        be `int` or `float`. This is applicable only to positional arguments
+        (`def func(values)`, not `def func(*values)`, since Python always
+        passes `*values` as a tuple).
+        ```python3
+        @command
+        def stats(values: Argument(type=float, container='array')):
+            return sum(values) / len(values)
+        ```
     '''
 
     def __init__(
@@ -342,6 +495,9 @@ class Argument:
             *,
             choices=None,
             completer=None,
+            completion_cache_ttl=None,
+            max_completions=None,
+            completion_timeout=None,
             completion_validator=None,
             aliases=(),
             append=False,
@@ -349,10 +505,16 @@ class Argument:
             type=None,
             required=False,
             remainder=False,
-            py_only=False):
+            py_only=False,
+            stdin=False,
+            chunk_size=None,
+            container=None):
         self.name = name
         self.choices = choices
         self.completer = completer
+        self.completion_cache_ttl = completion_cache_ttl
+        self.max_completions = max_completions
+        self.completion_timeout = completion_timeout
         self.aliases = aliases
         self.help = help
         self.type = type
@@ -361,6 +523,9 @@ class Argument:
         self.completion_validator = completion_validator
         self.append = append
         self.py_only = py_only
+        self.stdin = stdin
+        self.chunk_size = chunk_size
+        self.container = container
 
     def add_argument(self, cmd, arg_container, param):
         '''
@@ -391,8 +556,16 @@ class Argument:
         if self.py_only:
             return
 
+        from . import _choices
+        from . import _convert
         argument = None
         name = param.name.rstrip('_')
+        convert = _convert.argument_type(self, param)
+        choices = _choices.index(self.choices)
+        # The metavar of indexed choices only shows the first few of them
+        choices_metavar = (choices.metavar()
+                           if isinstance(choices, _choices.IndexedChoices)
+                           else None)
 
         # Validation
         if self.remainder and param.kind is not Parameter.VAR_POSITIONAL:
@@ -403,30 +576,78 @@ class Argument:
                 '"required" does not apply to positional arguments. Specify a '
                 'default value if you want optional positional args.\n'
                 'e.g. def func(foo=123)')
+        if self.stdin and param.kind not in (
+                Parameter.POSITIONAL_ONLY, Parameter.POSITIONAL_OR_KEYWORD):
+            raise RuntimeError(
+                'Stdin arg "{}" must be a positional argument, e.g. '
+                'def func(lines)'.format(param.name))
+        if self.chunk_size is not None and (
+                not self.stdin or self.chunk_size < 1):
+            raise RuntimeError(
+                '"chunk_size" of "{}" must be a positive number, and only '
+                'applies to stdin arguments'.format(param.name))
+        if self.container is not None:
+            if self.container not in _convert.CONTAINERS:
+                raise RuntimeError(
+                    'Unknown container "{}" for "{}". Supported containers '
+                    'are {}'.format(self.container, param.name,
+                                    ', '.join(_convert.CONTAINERS)))
+            if param.kind not in (Parameter.POSITIONAL_ONLY,
+                                  Parameter.POSITIONAL_OR_KEYWORD):
+                raise RuntimeError(
+                    'Container arg "{}" must be a positional argument, e.g. '
+                    'def func(values) instead of def func(*values)'
+                    .format(param.name))
+            if convert not in (int, float):
+                raise RuntimeError(
+                    'The type of container arg "{}" must be int or float'
+                    .format(param.name))
 
         # Add arguments
         if (param.kind is Parameter.POSITIONAL_ONLY or
                 param.kind is Parameter.POSITIONAL_OR_KEYWORD):
-            if param.default is Parameter.empty:
+            if self.stdin:
+                # Lines of the given files, or stdin:
+                #   def run(lines: Argument(stdin=True))
+                from . import _stdin
+                argument = arg_container.add_argument(
+                        param.name,
+                        metavar='file',
+                        nargs='*',
+                        action=_stdin.ReadLinesAction,
+                        chunk_size=self.chunk_size,
+                        help=self.help)
+            elif self.container is not None:
+                # Numbers converted in one pass:
+                #   def run(values: Argument(type=float, container='array'))
+                argument = arg_container.add_argument(
+                        param.name,
+                        metavar=name,
+                        nargs='*',
+                        action=_convert.ContainerAction,
+                        container=self.container,
+                        numeric_type=convert,
+                        help=self.help)
+            elif param.default is Parameter.empty:
                 # Most basic argument: def run(name)
                 argument = arg_container.add_argument(
                         param.name,
-                        metavar=name if not self.choices else None,
+                        metavar=name if not choices else choices_metavar,
                         nargs=None,
                         default=None,
-                        choices=self.choices,
+                        choices=choices,
                         help=self.help,
-                        type=self.type)
+                        type=convert)
             else:
                 # Optional argument: def run(name='foo')
                 argument = arg_container.add_argument(
                         param.name,
-                        metavar=name if not self.choices else None,
+                        metavar=name if not choices else choices_metavar,
                         nargs='?',
                         default=param.default,
-                        choices=self.choices,
+                        choices=choices,
                         help=self.help,
-                        type=self.type)
+                        type=convert)
         elif param.kind is Parameter.VAR_POSITIONAL:
             if param.name == '_REMAINDER_':
                 self.remainder = True
@@ -438,11 +659,11 @@ class Argument:
                 # Repeated argument: def run(*paths)
                 argument = arg_container.add_argument(
                     param.name,
-                    metavar=name if not self.choices else None,
+                    metavar=name if not choices else choices_metavar,
                     nargs='*',
-                    choices=self.choices,
+                    choices=choices,
                     help=self.help,
-                    type=self.type)
+                    type=convert)
         elif param.kind is Parameter.KEYWORD_ONLY:
             names = self.get_flag_names(name)
             nonames = self.get_negative_flag_names(name)
@@ -494,9 +715,10 @@ class Argument:
                     default=(param.default if not self.append
                              else list(param.default)),
                     dest=param.name,
-                    choices=self.choices,
+                    metavar=choices_metavar,
+                    choices=choices,
                     help=self.help,
-                    type=self.type,
+                    type=convert,
                     required=self.required)
         else:
             raise Exception(
@@ -528,14 +750,49 @@ class Argument:
 
 
 def _default_return_value_processor(val):
-    if val is not None:
-        print(val)
+    import io
+    from collections.abc import Iterator
+    try:
+        if isinstance(val, Iterator) and not isinstance(val, io.IOBase):
+            # Write the values as they are produced, without building the
+            # entire output in memory. Files are iterators too, but are
+            # printed like any other value.
+            write = sys.stdout.write
+            for item in val:
+                write('{}\n'.format(item))
+        elif val is not None:
+            print(val)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader exited early, e.g. in `command.py | head`. Stop
+        # generating values, and redirect stdout to devnull so Python does not
+        # report the error again when flushing stdout at exit.
+        if inspect.isgenerator(val):
+            val.close()
+        try:
+            stdout_fd = sys.stdout.fileno()
+        except (AttributeError, OSError):
+            # stdout was replaced by an object without a file descriptor, so
+            # there is nothing to redirect. Just suppress the error.
+            return
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, stdout_fd)
+        os.close(devnull)
+
+
+def _default_invoker(func, args, kwargs, opts):
+    return func(*args, **kwargs)
 
 
 def _default_exception_handler(exception):
+    # Avoid importing subprocess just for the exception handler. If the command
+    # hasn't imported it, CalledProcessError cannot have been raised.
+    subprocess = sys.modules.get('subprocess')
+    errors = ((subprocess.CalledProcessError, RuntimeError) if subprocess
+              else (RuntimeError,))
     try:
         raise exception
-    except (subprocess.CalledProcessError, RuntimeError) as e:
+    except errors as e:
         print('Error:', str(e), file=sys.stderr)
     except NoMatchingDelegate as e:
         print(str(e), file=sys.stderr)
@@ -568,7 +825,8 @@ class HashbangCommand:
     -   `return_value_processor` - A callable that takes the return value of
         the decorated function and processes it. When this is `None`, the
         default implementation is used, which is to `print()` the result to
-        stdout.
+        stdout, or each item on its own line if the result is an iterator
+        other than a file.
     -   `exception_handler` - A callable that takes the exception raised by the
         decorated function and processes it. This method should re-raise any
         exceptions it does not handle. When this is `None`, the default
@@ -580,6 +838,16 @@ class HashbangCommand:
         user did not supply a corresponding value from command line. To ensure
         extension operability, you should update or insert the dictionary with
         your values, rather than replacing the entire dictionary.
+    -   `invoker` - A callable `invoker(func, args, kwargs, opts)` which calls
+        the decorated function `func` with the positional arguments `args` and
+        keyword arguments `kwargs` parsed from the command line, and returns
+        the return value. `opts` is a dict of all the parsed values, including
+        the ones added by extensions which do not correspond to any parameter
+        of `func`. This is reset to the default, which simply calls
+        `func(*args, **kwargs)`, before the extensions are applied.
+    -   `parser_cache` - Whether to cache the resolved argument spec on disk.
+        See the documentation of `@command` for details. This can only be set
+        via kwargs, since the cache is read before extensions are applied.
 
     In addition, the following read-only fields are also available to allow
     extensions to get context on the function this command is running on:
@@ -601,50 +869,87 @@ class HashbangCommand:
     def __init__(self, func, extensions=(), **kwargs):
         # Read only by extensions (not enforced)
         self.func = func
-        self.signature = inspect.signature(func)
+        with _timing.phase('signature', self):
+            self.signature = inspect.signature(func)
         self.parser = None
         self.extensions = extensions
+        # Parsers built by previous executions, keyed by the delegation flag.
+        # The values are (parser, state, plan), where state is the return
+        # value of _parser_state() at the time the parser was built, and plan
+        # is the value of _args_plan for the parser.
+        self._parsers = {}
+        self._args_plan = ()
+        # The prog name guessed from sys.argv by the last execution, which is
+        # guessed again for each execution unless prog was set explicitly
+        self._guessed_prog = None
 
         # Modifiable by extensions
         self.arguments = OrderedDict()
         self.argparse_kwargs = {}
         self.default_values = {}
+        self.invoker = _default_invoker
 
         # Modifiable by extensions and via kwargs
         self.return_value_processor = _default_return_value_processor
         self.exception_handler = _default_exception_handler
 
+        # Modifiable via kwargs
+        self.parser_cache = None
+
         for key, value in kwargs.items():
             if key in ['prog', 'formatter_class', 'allow_abbrev']:
                 self.argparse_kwargs[key] = value
-            elif (key in ['return_value_processor', 'exception_handler']
+            elif (key in ['return_value_processor', 'exception_handler',
+                          'parser_cache']
                     and hasattr(self, key)):
                 setattr(self, key, value)
             else:
                 raise RuntimeError(
                     'Command property "{}" cannot be set'.format(key))
 
-    def _get_args(self, opts, remaining):
+    def _make_args_plan(self):
         '''
-        Turns the return values from argparse.parse_args or parse_known_args
-        into Python (*args, **kwargs) format.
+        Compiles `self.arguments` into a list of `(kind, name, default)`
+        tuples, so that `_get_args` does not need to inspect the parameters on
+        every execution.
         '''
-        args = []
-        kwargs = {}
+        plan = []
         for argname, (param, argument) in self.arguments.items():
             if param is None:
                 # Ignore params that doesn't exist in the signature (added by
                 # extensions)
                 continue
-            value = opts.get(argname, None)
             if argument.remainder:
-                args.extend(remaining)
+                kind = _REMAINDER
             elif (param.kind is Parameter.POSITIONAL_ONLY or
                     param.kind is Parameter.POSITIONAL_OR_KEYWORD):
-                args.append(value if value is not None else param.default)
-            elif param.kind is Parameter.VAR_POSITIONAL and value is not None:
+                kind = _POSITIONAL
+            elif param.kind is Parameter.VAR_POSITIONAL:
+                kind = _VAR_POSITIONAL
+            else:
+                kind = _KEYWORD
+            plan.append((kind, argname, param.default))
+        return tuple(plan)
+
+    def _get_args(self, opts, remaining):
+        '''
+        Turns the return values from argparse.parse_args or parse_known_args
+        into Python (*args, **kwargs) format.
+        '''
+        args = []
+        kwargs = {}
+        for kind, argname, default in self._args_plan:
+            if kind is _REMAINDER:
+                args.extend(remaining)
+                continue
+            value = opts.get(argname, None)
+            if kind is _POSITIONAL:
+                args.append(value if value is not None else default)
+            elif value is None:
+                continue
+            elif kind is _VAR_POSITIONAL:
                 args.extend(value)
-            elif value is not None:
+            else:
                 kwargs[argname] = value
         return (args, kwargs)
 
@@ -655,11 +960,27 @@ class HashbangCommand:
     def _exec_mode(mode):
         original_mode = HashbangCommand.exec_mode
         HashbangCommand.exec_mode = mode
-        yield
-        HashbangCommand.exec_mode = original_mode
+        try:
+            yield
+        finally:
+            # Restore the mode even when the help or completion exits, so
+            # that later executions in the same process are not affected
+            HashbangCommand.exec_mode = original_mode
 
     def execute(self, args=None, **kwargs):
+        if kwargs:
+            # The default values given for this execution, e.g. by a
+            # delegator, do not carry over to later executions in the same
+            # process
+            with self._restore_default_values():
+                return self._execute_in_mode(args, **kwargs)
+        return self._execute_in_mode(args)
+
+    def _execute_in_mode(self, args, **kwargs):
         if self.exec_mode == 'execute':
+            if args is None:
+                _timing.record_import()
+                self._start_daemon()
             return self._execute_with_error_handling(args, **kwargs)
         elif self.exec_mode == 'help':
             return self.help(args)
@@ -667,6 +988,85 @@ class HashbangCommand:
             return self.complete(args)
         raise RuntimeError('Unknown execution mode {}'.format(self.exec_mode))
 
+    @contextmanager
+    def _restore_default_values(self):
+        original_defaults = dict(self.default_values)
+        try:
+            yield
+        finally:
+            self.default_values.clear()
+            self.default_values.update(original_defaults)
+
+    def _start_daemon(self):
+        # hashbang.daemon is only imported if the script uses it, or if daemon
+        # mode is enabled for all scripts
+        daemon = sys.modules.get('hashbang.daemon')
+        if daemon is None and os.environ.get('HASHBANG_DAEMON') == '1':
+            from . import daemon
+        if daemon is not None:
+            daemon.start(self)
+
+    def execute_many(self, argvs, workers=None, **kwargs):
+        '''
+        Executes the command once for each list of arguments in `argvs`,
+        yielding `(result, exit_code)` for each of them. See the documentation
+        of `@command` for details.
+        '''
+        with self._restore_default_values():
+            self.default_values.update(kwargs)
+            if workers is None:
+                for args in argvs:
+                    yield self._execute_without_exit(args)
+            else:
+                yield from self._execute_many_in_pool(argvs, workers)
+
+    def _execute_many_in_pool(self, argvs, workers):
+        from collections import deque
+        from concurrent.futures import ThreadPoolExecutor
+        # Set up the parser before starting the threads, which then share it
+        # without modifying it
+        parser = self._prepare_parser(None)
+        with ThreadPoolExecutor(workers) as executor:
+            # Limit the number of pending calls, so that argvs can be consumed
+            # lazily
+            pending = deque()
+            for args in argvs:
+                pending.append(executor.submit(
+                    self._execute_without_exit, args, parser))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _execute_without_exit(self, args, parser=None):
+        '''
+        Executes the command like `execute`, but returns `(result, exit_code)`
+        instead of calling `sys.exit`. If `parser` is given, it is used as it
+        is instead of setting up the parser for this execution.
+        '''
+        try:
+            try:
+                if parser is None:
+                    return_value = self._execute_with_list(args=args)
+                else:
+                    return_value = self._execute_with_parser(parser, args)
+                return_value = self._process_return_value(return_value)
+            finally:
+                _profile.stop(self)
+            return (return_value, 0)
+        except SystemExit as e:
+            return (None, _exit_code(e))
+        except Exception as e:
+            try:
+                self.exception_handler(e)
+            except SystemExit as exit:
+                return (e, _exit_code(exit))
+            except Exception:
+                # Exceptions not handled by the exception handler are
+                # returned to the caller instead of being raised
+                pass
+            return (e, 1)
+
     def _execute_with_error_handling(self, args=None, **kwargs):
         try:
             try:
@@ -674,21 +1074,82 @@ class HashbangCommand:
                 setproctitle.setproctitle(sys.argv[0])
             except Exception:
                 pass
-            return_value = self._execute_with_list(args=args, **kwargs)
-            self.return_value_processor(return_value)
+            try:
+                with _timing.phase('execute', self):
+                    return_value = self._execute_with_list(args=args, **kwargs)
+                self._process_return_value(return_value)
+            finally:
+                _profile.stop(self)
             sys.exit(0)
         except BaseException as e:
             self.exception_handler(e)
         sys.exit(1)
 
+    def _process_return_value(self, return_value):
+        '''
+        Passes the return value of the function to `return_value_processor`,
+        and returns it. If the function is a coroutine function, the coroutine
+        is run on an event loop first, and its result is used instead. If it
+        is an async generator, each of the generated values are passed to the
+        return value processor as soon as they are generated, and `None` is
+        returned.
+        '''
+        if inspect.iscoroutine(return_value):
+            from . import _async
+            with _timing.phase('await', self):
+                return_value = _async.run(return_value)
+        elif _isasyncgen(return_value):
+            from . import _async
+            with _timing.phase('await', self):
+                _async.stream(return_value, self.return_value_processor)
+            return None
+        with _timing.phase('return_value', self):
+            self.return_value_processor(return_value)
+        return return_value
+
     def _create_parser(self, args, delegation=False):
-        if 'prog' not in self.argparse_kwargs and args is not None:
+        prog = self.argparse_kwargs.get('prog')
+        if (prog is None or prog == self._guessed_prog) and args is not None:
             # Try to create a sensible default for prog name
             argv = sys.argv
-            argv[0] = Path(argv[0]).name
+            argv[0] = os.path.basename(argv[0])
             guess_prog = ' '.join(arg for arg in argv
                                   if arg not in (list(args) + ['--']))
-            self.argparse_kwargs['prog'] = guess_prog
+            if guess_prog != prog:
+                self.argparse_kwargs['prog'] = self._guessed_prog = guess_prog
+
+        parser, state, plan = self._parsers.get(delegation, (None, None, None))
+        if parser is not None and _identical(state, self._parser_state()):
+            self.parser = parser
+            self._args_plan = plan
+            return parser
+        with _timing.phase('create_parser', self, delegation=delegation):
+            parser = self._build_parser(delegation)
+            self._args_plan = self._make_args_plan()
+        self._parsers[delegation] = (
+            parser, self._parser_state(), self._args_plan)
+        return parser
+
+    def _parser_state(self):
+        '''
+        The state which the parser is built from, other than the function
+        itself. The parser is only rebuilt if one of these changes between
+        executions.
+        '''
+        return (tuple(self.extensions),
+                tuple(self.argparse_kwargs.items()),
+                tuple(self.default_values.items()))
+
+    def _build_parser(self, delegation):
+        cache = None
+        if self.parser_cache:
+            from . import _parsercache
+        if self.parser_cache and _parsercache.is_cacheable(self):
+            cache = _parsercache.ParserSpecCache(self, self.parser_cache)
+            with _timing.phase('parser_cache', self):
+                spec = cache.load()
+            if spec is not None:
+                return self._create_parser_from_spec(spec, delegation)
 
         # Parse the description and usage from the docstring
         doc = inspect.getdoc(self.func)
@@ -707,38 +1168,90 @@ class HashbangCommand:
                 else Argument()))
             for _, param in self.signature.parameters.items())
 
-        for extension in self.extensions:
-            if not callable(getattr(extension, 'apply_hashbang_extension')):
-                raise RuntimeError(
-                    'extensions passed in @command must implement the method '
-                    '"apply_hashbang_extension"')
-            extension.apply_hashbang_extension(self)
+        self.invoker = _default_invoker
+        with _timing.phase('extensions', self):
+            for extension in self.extensions:
+                if not callable(
+                        getattr(extension, 'apply_hashbang_extension')):
+                    raise RuntimeError(
+                        'extensions passed in @command must implement the '
+                        'method "apply_hashbang_extension"')
+                extension.apply_hashbang_extension(self)
+
+        with _timing.phase('argparse_init', self):
+            self.parser = _CommandParser(
+                description=description,
+                usage=usage,
+                add_help=False,
+                **self.argparse_kwargs)
+        self.parser.delegation = delegation
+        if cache is not None:
+            self.parser.spec = []
+
+        with _timing.phase('add_arguments', self):
+            for name, (param, argument) in self.arguments.items():
+                retargument = argument.add_argument(self, self.parser, param)
+                completion._add_argument(self, argument, retargument)
+            _profile.add_option(self.parser)
+
+        if cache is not None:
+            cache.store({
+                'description': description,
+                'usage': usage,
+                'calls': self.parser.spec,
+                'parse_known': self.parser.parse_known,
+                'arguments': [(name, argument.remainder)
+                              for name, (_, argument)
+                              in self.arguments.items()],
+            })
+            self.parser.spec = None
+
+        self.parser.set_defaults(**self.default_values)
 
+        return self.parser
+
+    def _create_parser_from_spec(self, spec, delegation):
+        '''
+        Creates the parser from a spec loaded from the parser cache, without
+        inspecting the function or applying the extensions again.
+        '''
+        self.arguments = OrderedDict(
+            (name, (self.signature.parameters.get(name),
+                    Argument(name, remainder=remainder)))
+            for name, remainder in spec['arguments'])
         self.parser = _CommandParser(
-            description=description,
-            usage=usage,
+            description=spec['description'],
+            usage=spec['usage'],
             add_help=False,
             **self.argparse_kwargs)
         self.parser.delegation = delegation
-
-        for name, (param, argument) in self.arguments.items():
-            retargument = argument.add_argument(self, self.parser, param)
-            completion._add_argument(argument, retargument)
-
+        self.parser.parse_known = spec['parse_known']
+        from . import _parsercache
+        _parsercache.replay(self.parser, spec['calls'])
         self.parser.set_defaults(**self.default_values)
-
         return self.parser
 
     def _execute_delegation(self, args=None):
         self._create_parser(args, delegation=True)
-        parsed, remaining = self.parser.parse(args)
+        with _timing.phase('parse', self):
+            parsed, remaining = self.parser.parse(args)
         func_args, func_kwargs = self._get_args(vars(parsed), remaining)
         func_args = [arg if arg is not Parameter.empty else None
                      for arg in func_args]
-        return self.func(*func_args, **func_kwargs)
+        with _timing.phase('call', self):
+            return_value = self.func(*func_args, **func_kwargs)
+        if inspect.iscoroutine(return_value):
+            # An `async def` delegator, which executes the delegate when it is
+            # run
+            from . import _async
+            with _timing.phase('await', self):
+                return_value = _async.run(return_value)
+        return return_value
 
     def help(self, args):
-        if self.parser is None:
+        if self.parser is None or self.exec_mode == 'help':
+            # Delegated help uses the parser without the help flag, even if
+            # the command was already executed in this process
             self._create_parser(args, delegation=True)
         self.parser.print_help()
         self.parser.exit(0)
@@ -746,7 +1259,7 @@ class HashbangCommand:
     def complete(self, args):
         return completion._execute_complete(self, args)
 
-    def _make_help_action(self, args):
+    def _make_help_action(self):
         class HelpAction(argparse.Action):
 
             def __init__(_,
@@ -762,7 +1275,7 @@ class HashbangCommand:
                     help=help)
 
             def __call__(_, parser, namespace, values, option_string=None):
-                self.help(args)
+                self.help(getattr(namespace, _ARGS_DEST, None))
 
         return HelpAction
 
@@ -773,27 +1286,129 @@ class HashbangCommand:
         '''
 
         self.default_values.update(kwargs)
-        self._create_parser(args)
-        self.parser.add_argument(
-                '-h', '--help',
-                action=self._make_help_action(args), default=argparse.SUPPRESS,
-                help='show this help message and exit')
+        return self._execute_with_parser(self._prepare_parser(args), args)
 
-        completion._modify_parser(self, self.parser, args)
+    def _prepare_parser(self, args):
+        '''
+        Creates the parser for executing with `args`, or reuses the one built
+        by a previous execution, and adds the help flag to it.
+        '''
+        parser = self._create_parser(args)
+        if not parser.has_help:
+            parser.add_argument(
+                    '-h', '--help',
+                    action=self._make_help_action(),
+                    default=argparse.SUPPRESS,
+                    help='show this help message and exit')
+            parser.has_help = True
+        return parser
+
+    def _execute_with_parser(self, parser, args):
+        '''
+        Parses `args` with the prepared `parser` and runs self.func. This does
+        not modify the parser, so it can be called from multiple threads.
+        '''
+        completion._modify_parser(self, parser, args)
 
-        parsed, remaining = self.parser.parse(
-                args if args is not None else sys.argv[1:])
-        func_args, func_kwargs = self._get_args(vars(parsed), remaining)
-        return self.func(*func_args, **func_kwargs)
+        # The arguments are passed to the actions in the namespace rather
+        # than stored on the parser, which may be shared by other executions
+        namespace = argparse.Namespace(**{_ARGS_DEST: args})
+        with _timing.phase('parse', self):
+            try:
+                parsed, remaining = parser.parse(
+                        args if args is not None else sys.argv[1:], namespace)
+            except _StopParsing:
+                # The invoker handles the namespace parsed so far
+                parsed, remaining = namespace, []
+        opts = vars(parsed)
+        del opts[_ARGS_DEST]
+        _profile.start(
+            self, opts, isinstance(self, _DelegatingHashbangCommand))
+        func_args, func_kwargs = self._get_args(opts, remaining)
+        with _timing.phase('call', self):
+            return self.invoker(self.func, func_args, func_kwargs, opts)
+
+
+class _StopParsing(Exception):
+    '''
+    Raised by an argparse action to stop parsing the rest of the arguments,
+    e.g. because they are going to be read from somewhere else. Parsing ends
+    without checking the required arguments, and the invoker is called with
+    the values parsed so far, as with any other execution.
+    '''
+
+
+def _exit_code(system_exit):
+    '''
+    Returns the exit code the interpreter would exit with if the given
+    `SystemExit` is not caught.
+    '''
+    code = system_exit.code
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _identical(a, b):
+    '''
+    Compares two (possibly nested) tuples by the identity of their items. This
+    is used instead of `==`, which may be expensive or not return a bool for
+    arbitrary default values.
+    '''
+    if type(a) is tuple and type(b) is tuple:
+        return len(a) == len(b) and all(map(_identical, a, b))
+    return a is b
 
 
 class _DelegatingHashbangCommand(HashbangCommand):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # The table of subcommands, if this delegator is created using
+        # `subcommands`. This allows tools to walk the command tree without
+        # executing the delegator.
+        self.subcommands = None
+
+    def _delegate_by_name(self, args):
+        '''
+        Executes the subcommand named by the first of `args` using the table of
+        `subcommands`, without building the parser of this delegator. Returns
+        the pair `(True, result)` if the subcommand was executed, or
+        `(False, None)` if the arguments need to be parsed to find the
+        delegate.
+        '''
+        if args is None:
+            args = sys.argv[1:]
+        if self.subcommands is None or not args:
+            return False, None
+        cmd = self.subcommands.get(args[0])
+        if cmd is None:
+            return False, None
+        with _timing.phase('call', self, subcommand=args[0]):
+            return True, _resolve_subcommand(cmd).execute(args[1:])
+
+    def _execute_with_list(self, args=None, **kwargs):
+        # The parser of the outermost command is needed to hook into
+        # argcomplete, and to switch to help mode if --help is given anywhere
+        # in the arguments, so it is only skipped otherwise
+        argv = args if args is not None else sys.argv[1:]
+        options = argv[:argv.index('--')] if '--' in argv else argv
+        if ('_ARGCOMPLETE' not in os.environ and
+                '-h' not in options and '--help' not in options):
+            self.default_values.update(kwargs)
+            delegated, result = self._delegate_by_name(argv)
+            if delegated:
+                return result
+        return super()._execute_with_list(args, **kwargs)
 
     def help(self, args):
         with self._exec_mode('help'):
+            delegated, result = self._delegate_by_name(args)
+            if delegated:
+                return result
             try:
                 return super()._execute_delegation(args)
             except NoMatchingDelegate as e:
@@ -802,6 +1417,9 @@ class _DelegatingHashbangCommand(HashbangCommand):
 
     def complete(self, args):
         with self._exec_mode('complete'):
+            delegated, result = self._delegate_by_name(args)
+            if delegated:
+                return result
             try:
                 return super()._execute_delegation(args)
             except NoMatchingDelegate as e:
@@ -827,6 +1445,19 @@ def subcommands(*args, **kwargs):
     `git.py commit` is executed, it will call `commit_func.execute(...)` with
     all the remaining arguments. `commit_func` and `branch_func` should also be
     a `@command`.
+
+    Instead of the command itself, a subcommand can also be given as an import
+    path in the form `'module:attribute'`, e.g.
+    `subcommands(commit='mygit.commit:main')`. The module is only imported
+    when that subcommand is executed, so CLIs with many subcommands do not need
+    to import all of them (and their dependencies) to run one, or to show the
+    help message and completions, which only use the names of the subcommands.
+
+    Since the subcommands are known ahead of time, the subcommand to delegate
+    to is looked up by name from the first argument, without building the
+    argument parser of the delegator. Only the command that handles the
+    request, e.g. the innermost subcommand in `git.py remote add --help`,
+    builds its parser.
     '''
 
     if sys.version_info >= (3, 6):
@@ -837,6 +1468,12 @@ def subcommands(*args, **kwargs):
         # natural order to keep the order predictable
         cmds = OrderedDict(args or sorted(kwargs.items()))
 
+    for name, cmd in cmds.items():
+        if isinstance(cmd, str) and not re.match(r'^[\w.]+:[\w.]+$', cmd):
+            raise RuntimeError(
+                'Subcommand "{}" must be a command or an import path in the '
+                'form "module:attribute", got "{}"'.format(name, cmd))
+
     @command.delegator
     def _run(
             subcommand: Argument(choices=cmds.keys()),
@@ -844,6 +1481,25 @@ def subcommands(*args, **kwargs):
         cmd = cmds.get(subcommand, None)
         if cmd is None:
             raise NoMatchingDelegate()
-        return cmd.execute(_REMAINDER_)
+        return _resolve_subcommand(cmd).execute(_REMAINDER_)
 
+    _run._hashbang_command.subcommands = cmds
     return _run
+
+
+def _resolve_subcommand(cmd):
+    '''
+    Returns the command for an entry in the table of `subcommands`, importing
+    it first if it is given as a `'module:attribute'` string.
+    '''
+    if not isinstance(cmd, str):
+        return cmd
+    import importlib
+    module_name, attribute = cmd.split(':', 1)
+    cmd = importlib.import_module(module_name)
+    for part in attribute.split('.'):
+        cmd = getattr(cmd, part)
+    if not hasattr(cmd, '_hashbang_command'):
+        raise RuntimeError(
+            '"{}:{}" is not a hashbang command'.format(module_name, attribute))
+    return cmd
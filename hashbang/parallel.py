@@ -0,0 +1,203 @@
+'''
+Runs the decorated function concurrently for each of the values of its
+var-positional parameter.
+'''
+
+import os
+import sys
+from inspect import Parameter, isgenerator
+
+from .hashbang import Argument, _default_return_value_processor
+
+__all__ = ['Parallel']
+
+
+class Parallel(Argument):
+    '''
+    An extension that calls the decorated function once for each value of its
+    var-positional parameter (`*args`), concurrently in a thread pool or a
+    process pool.
+
+    ```python3
+    @command(Parallel())
+    def compress(*files, level='9'):
+        ...
+    ```
+
+    `compress.py a.txt b.txt --level 3` will then call
+    `compress('a.txt', level='3')` and `compress('b.txt', level='3')`
+    concurrently. Each return value other than `None` is passed to the
+    return value processor as soon as it is available, so the default one
+    prints each of them on its own line. Giving no values for the
+    var-positional parameter is an error, since the function would not be
+    called at all.
+
+    The following flags are added to the command:
+    -   `--jobs N` - The maximum number of calls to run at the same time. The
+        default is the number of CPUs.
+    -   `--ordered` / `--unordered` - Whether the return values are processed
+        in the order of the arguments, or as soon as each call finishes.
+    -   `--fail-fast` - Cancel the remaining calls as soon as one of them
+        raises an exception. Otherwise the remaining calls continue, and the
+        first exception is raised after all of them have finished.
+
+    On Ctrl-C, the calls that have not started yet are cancelled. The calls
+    that are already running cannot be interrupted, so the process exits once
+    they have finished.
+
+    ```python3
+    Parallel(*, processes=False, jobs=None, ordered=True)
+    ```
+    -   `processes` - Whether to use a process pool instead of a thread pool.
+        Use this for CPU-bound functions, which cannot run in parallel in
+        threads because of the GIL. The function, its arguments and its
+        return values must be picklable.
+    -   `jobs` - The default value of `--jobs`.
+    -   `ordered` - The default value of `--ordered`.
+    '''
+
+    def __init__(self, *, processes=False, jobs=None, ordered=True):
+        super().__init__()
+        self.processes = processes
+        self.jobs = jobs
+        self.ordered = ordered
+
+    def apply_hashbang_extension(self, cmd):
+        params = list(cmd.signature.parameters.values())
+        var_positional = [i for i, param in enumerate(params)
+                          if param.kind is Parameter.VAR_POSITIONAL]
+        if not var_positional:
+            raise RuntimeError(
+                'Parallel requires the function to have a var-positional '
+                'parameter (*args)')
+        # The values of the var-positional parameter come after the other
+        # positional arguments in the args passed to the invoker
+        fixed = var_positional[0]
+        name = params[fixed].name
+
+        def invoker(func, args, kwargs, opts):
+            if len(args) <= fixed:
+                raise RuntimeError('No values given for *{}'.format(name))
+            return self._generate(
+                func, args[:fixed], args[fixed:], kwargs,
+                jobs=opts['parallel_jobs'],
+                ordered=opts['parallel_ordered'],
+                fail_fast=opts['parallel_fail_fast'])
+
+        cmd.arguments['_parallel'] = (None, self)
+        cmd.invoker = invoker
+        # The default return value processor writes the values as they are
+        # generated, and stops the generator if stdout is closed. Other
+        # processors are called with each of the values.
+        processor = cmd.return_value_processor
+        if not (processor is _default_return_value_processor or
+                isinstance(processor, _EachValue)):
+            cmd.return_value_processor = _EachValue(processor)
+
+    def add_argument(self, cmd, parser, param):
+        parser.add_argument(
+            '--jobs',
+            type=int,
+            default=self.jobs or os.cpu_count() or 1,
+            metavar='N',
+            dest='parallel_jobs',
+            help='Number of calls to run at the same time (default: '
+                 '%(default)s)')
+        parser.add_argument(
+            '--ordered',
+            action='store_true',
+            default=self.ordered,
+            dest='parallel_ordered',
+            help='Output the results in the order of the arguments')
+        parser.add_argument(
+            '--unordered',
+            action='store_false',
+            dest='parallel_ordered',
+            help='Output the results as soon as they are ready')
+        parser.add_argument(
+            '--fail-fast',
+            action='store_true',
+            dest='parallel_fail_fast',
+            help='Cancel the remaining calls after the first failure')
+
+    def _generate(self, func, args, values, kwargs, *,
+                  jobs, ordered, fail_fast):
+        '''
+        Calls `func(*args, value, **kwargs)` for each of the `values`, and
+        yields the results.
+        '''
+        if jobs <= 1 or len(values) <= 1:
+            calls = (_Call(func, args + [value], kwargs) for value in values)
+            yield from _results(calls, fail_fast)
+            return
+
+        from concurrent.futures import (
+            ProcessPoolExecutor, ThreadPoolExecutor, as_completed)
+        executor = (ProcessPoolExecutor if self.processes
+                    else ThreadPoolExecutor)(min(jobs, len(values)))
+        futures = []
+        try:
+            futures = [executor.submit(func, *args, value, **kwargs)
+                       for value in values]
+            yield from _results(
+                futures if ordered else as_completed(futures), fail_fast)
+        finally:
+            # Cancel the calls that have not started if this is stopped early,
+            # e.g. by KeyboardInterrupt, --fail-fast, or if the reader of
+            # stdout exited. The running calls still finish.
+            if sys.version_info >= (3, 9):
+                executor.shutdown(wait=False, cancel_futures=True)
+            else:
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=False)
+
+
+class _EachValue:
+    '''
+    A return value processor which passes each of the values generated by
+    `Parallel` to `processor`.
+    '''
+
+    def __init__(self, processor):
+        self.processor = processor
+
+    def __call__(self, values):
+        if not isgenerator(values):
+            # Returned by an invoker wrapping the one of `Parallel`, e.g. the
+            # one of `Batch`
+            self.processor(values)
+            return
+        for value in values:
+            self.processor(value)
+
+
+class _Call:
+    '''
+    A call which runs synchronously, with the same `result()` API as a
+    `concurrent.futures.Future`.
+    '''
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def result(self):
+        return self.func(*self.args, **self.kwargs)
+
+
+def _results(futures, fail_fast):
+    error = None
+    for future in futures:
+        try:
+            result = future.result()
+        except Exception as e:
+            if fail_fast:
+                raise
+            error = error or e
+            continue
+        if result is not None:
+            yield result
+    if error is not None:
+        raise error
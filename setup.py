@@ -24,6 +24,11 @@ setuptools.setup(
     extras_require={
         "completion": ["argcomplete"]
     },
+    entry_points={
+        "console_scripts": [
+            "hashbang-completion = hashbang.completion_script:main.execute",
+        ],
+    },
     python_requires='~=3.4',
     classifiers=[
         "Programming Language :: Python :: 3",
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+'''
+$ completion_cache.py --reset
+Cleared
+
+$ completion_cache.py --branch <TAB>
+dev-1\x0bmain-1
+
+$ completion_cache.py --branch m<TAB>
+main-1 
+
+$ completion_cache.py --age
+Aged 1 entries
+
+$ completion_cache.py --branch <TAB>
+dev-1\x0bmain-1
+
+$ completion_cache.py --wait
+Refreshed while holding the lock
+
+$ completion_cache.py --branch <TAB>
+dev-2\x0bmain-2
+
+$ completion_cache.py --remote upstream --branch <TAB>
+dev-3\x0bmain-3
+'''
+
+import os
+import sys
+import tempfile
+import time
+
+os.environ['XDG_CACHE_HOME'] = os.path.join(
+    tempfile.gettempdir(), 'hashbang_completion_cache_test')
+COUNTER = os.path.join(os.environ['XDG_CACHE_HOME'], 'counter')
+LOCKED = os.path.join(os.environ['XDG_CACHE_HOME'], 'locked')
+
+from hashbang import command, Argument
+from hashbang._utils import cache_dir
+
+
+def list_branches(**kwargs):
+    # Simulates a slow completer, counting the number of times it is called
+    with open(COUNTER, 'r+') as f:
+        count = int(f.read() or 0) + 1
+        f.seek(0)
+        f.write(str(count))
+    # Records whether another refresh would be prevented by the lock
+    with open(LOCKED, 'w') as f:
+        f.write(str(any(path.endswith('.lock') for path in os.listdir(
+            cache_dir('completions')))))
+    return ['dev-{}'.format(count), 'main-{}'.format(count)]
+
+
+def cache_entries():
+    directory = cache_dir('completions')
+    return [os.path.join(directory, name) for name in os.listdir(directory)
+            if name.endswith('.json')]
+
+
+@command
+def main(
+        *,
+        branch: Argument(completer=list_branches, completion_cache_ttl=60)
+        = None,
+        remote='origin',
+        reset=False,
+        age=False,
+        wait=False):
+    if reset:
+        import shutil
+        shutil.rmtree(os.environ['XDG_CACHE_HOME'], ignore_errors=True)
+        os.makedirs(cache_dir('completions'))
+        open(COUNTER, 'w').close()
+        print('Cleared')
+    if age:
+        # Make the cached entry stale, but not expired
+        import json
+        for path in cache_entries():
+            with open(path) as f:
+                entry = json.load(f)
+            entry['time'] -= 120
+            with open(path, 'w') as f:
+                json.dump(entry, f)
+        print('Aged {} entries'.format(len(cache_entries())))
+    if wait:
+        # Wait for the entry to be refreshed in the background
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            with open(COUNTER) as f:
+                if f.read() == '2' and not any(
+                        name.endswith('.lock') for name
+                        in os.listdir(cache_dir('completions'))):
+                    with open(LOCKED) as locked:
+                        print('Refreshed while holding the lock'
+                              if locked.read() == 'True'
+                              else 'Refreshed without the lock')
+                    return
+            time.sleep(0.05)
+        sys.exit('Timed out waiting for the refresh')
+
+
+if __name__ == '__main__':
+    main.execute()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+'''
+$ completion_limits.py --number <TAB>
+0\x0b1\x0b2
+
+$ completion_limits.py --number 4<TAB>
+4\x0b40\x0b41
+
+$ completion_limits.py --host <TAB>
+alpha\x0bbeta
+
+$ completion_limits.py --host a<TAB>
+alpha 
+'''
+
+import itertools
+import time
+
+from hashbang import command, Argument
+
+
+def numbers(**kwargs):
+    # Never ends, so this relies on max_completions
+    return (str(i) for i in itertools.count())
+
+
+def hosts(**kwargs):
+    yield 'alpha'
+    yield 'beta'
+    # Simulates a slow lookup, which is cut off by completion_timeout
+    time.sleep(30)
+    yield 'gamma'
+
+
+@command
+def main(
+        *,
+        number: Argument(completer=numbers, max_completions=3) = None,
+        host: Argument(completer=hosts, completion_timeout=0.5) = None):
+    print('number={} host={}'.format(number, host))
+
+
+if __name__ == '__main__':
+    main.execute()
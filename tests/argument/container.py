@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+'''
+$ container.py mean 1.5 2 3.25
+values=array('d', [1.5, 2.0, 3.25]) mean=2.25
+
+$ container.py mean
+values=array('d') mean=None
+
+$ container.py count 3 -4 5
+counts=array('q', [3, -4, 5]) total=4
+
+$ container.py mean 1.5 x 2  # returncode=2 stderr=True glob=True
+...
+container.py mean: error: argument values: invalid float value: 'x'
+
+$ container.py count 3 99999999999999999999  # returncode=2 stderr=True glob=True
+...
+container.py count: error: argument counts: invalid int value: '99999999999999999999'
+
+$ container.py invalid 1 2  # returncode=1 stderr=True
+Error: Container arg "values" must be a positional argument, e.g. def func(values) instead of def func(*values)
+'''
+
+from hashbang import command, subcommands, Argument
+
+
+@command
+def mean(values: Argument(type=float, container='array')):
+    print('values={} mean={}'.format(
+        values, sum(values) / len(values) if values else None))
+
+
+@command(Argument('counts', container='array'))
+def count(counts: int):
+    print('counts={} total={}'.format(counts, sum(counts)))
+
+
+@command
+def invalid(*values: Argument(type=float, container='array')):
+    print(values)
+
+
+main = subcommands(mean=mean, count=count, invalid=invalid)
+
+
+if __name__ == '__main__':
+    main.execute()
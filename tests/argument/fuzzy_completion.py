@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+'''
+$ fuzzy_completion.py ha/comp<TAB>
+hashbang/completion.py\x0bhashbang/completion_script.py
+
+$ fuzzy_completion.py hbcmp<TAB>
+hashbang/completion.py\x0bhashbang/completion_script.py
+
+$ fuzzy_completion.py comp<TAB>
+hashbang/completion.py\x0btests/argument/completer.py\x0bhashbang/completion_script.py
+
+$ fuzzy_completion.py READ<TAB>
+README.md 
+
+$ fuzzy_completion.py --module h.c<TAB>
+hashbang.completion\x0bhashbang.completion_script
+
+$ fuzzy_completion.py <TAB>
+README.md\x0bhashbang/__init__.py\x0bhashbang/completion.py
+
+$ fuzzy_completion.py --module <TAB>
+hashbang\x0bhashbang.completion\x0bhashbang.completion_script\x0bhashbang.hashbang
+'''
+
+from hashbang import command, Argument
+from hashbang.completion import FuzzyIndex, FuzzyMatcher
+
+PATHS = FuzzyIndex([
+    'README.md',
+    'hashbang/__init__.py',
+    'hashbang/completion.py',
+    'hashbang/completion_script.py',
+    'hashbang/hashbang.py',
+    'tests/argument/completer.py',
+    'tests/hashbang_test.py',
+])
+
+
+@command
+def main(
+        path: Argument(
+            completer=lambda **_: PATHS,
+            completion_validator=FuzzyMatcher(limit=3, sep='/')),
+        *,
+        module: Argument(
+            completer=lambda **_: (
+                'hashbang', 'hashbang.completion',
+                'hashbang.completion_script', 'hashbang.hashbang'),
+            completion_validator=FuzzyMatcher(sep='.')) = None):
+    print(path, module)
+
+
+if __name__ == '__main__':
+    main.execute()
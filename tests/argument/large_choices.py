@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+'''
+$ large_choices.py deploy --help  # glob=True
+usage: large_choices.py deploy [--region {r-00,r-01,r-02,r-03,r-04,...}]
+*{host-0000,host-0001,host-0002,host-0003,host-0004,...}
+...
+
+$ large_choices.py deploy host-0512 --region r-42
+Deploying host-0512 to r-42
+
+$ large_choices.py deploy host-9999  # returncode=2 stderr=True glob=True
+...error: argument host: invalid choice: 'host-9999' (choose from 'host-0000', 'host-0001', 'host-0002', 'host-0003', 'host-0004', ... (995 more))
+
+$ large_choices.py deploy host-099<TAB>
+host-0990\x0bhost-0991\x0bhost-0992\x0bhost-0993\x0bhost-0994\x0bhost-0995\x0bhost-0996\x0bhost-0997\x0bhost-0998\x0bhost-0999
+
+$ large_choices.py deploy host-0512 --region r-9<TAB>
+r-90\x0br-91\x0br-92\x0br-93\x0br-94\x0br-95\x0br-96\x0br-97\x0br-98\x0br-99
+
+$ large_choices.py job-14<TAB>
+job-14\x0bjob-140\x0bjob-141\x0bjob-142\x0bjob-143\x0bjob-144\x0bjob-145\x0bjob-146\x0bjob-147\x0bjob-148\x0bjob-149
+
+$ large_choices.py job-7 123
+job-7 123
+
+$ large_choices.py --help  # glob=True
+usage: large_choices.py {deploy,job-0,job-1,job-2,job-3,...}
+...
+'''
+
+from hashbang import command, subcommands, Argument
+
+HOSTS = ['host-{:04}'.format(i) for i in range(1000)]
+REGIONS = ['r-{:02}'.format(i) for i in range(200)]
+
+
+@command
+def deploy(
+        host: Argument(choices=HOSTS),
+        *,
+        region: Argument(choices=REGIONS) = 'r-00'):
+    print('Deploying', host, 'to', region)
+
+
+def make_job(name):
+    @command
+    def job(arg):
+        print(name, arg)
+    return job
+
+
+main = subcommands(
+    ('deploy', deploy),
+    *[('job-{}'.format(i), make_job('job-{}'.format(i))) for i in range(500)])
+
+
+if __name__ == '__main__':
+    main.execute()
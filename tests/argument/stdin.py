@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+'''
+$ stdin.py upper < stdin.txt
+HELLO
+WORLD
+FOO BAR
+
+$ stdin.py upper --prefix 'line: ' - < stdin.txt
+line: HELLO
+line: WORLD
+line: FOO BAR
+
+$ stdin.py upper stdin.txt - < stdin_last.txt
+HELLO
+WORLD
+FOO BAR
+LAST LINE WITHOUT NEWLINE
+
+$ stdin.py chunks stdin.txt stdin.txt
+['hello', 'world']
+['foo bar', 'hello']
+['world', 'foo bar']
+
+$ stdin.py first stdin.txt missing.txt
+hello
+
+$ stdin.py upper stdin.txt missing.txt  # returncode=1 stderr=True
+Error: Cannot read missing.txt: No such file or directory
+'''
+
+from hashbang import command, subcommands, Argument
+
+
+@command
+def upper(lines: Argument(stdin=True), *, prefix=''):
+    for line in lines:
+        yield prefix + line.upper()
+
+
+@command(Argument('lines', stdin=True, chunk_size=2))
+def chunks(lines):
+    return lines
+
+
+@command
+def first(lines: Argument(stdin=True)):
+    # Only the first line is read, so later files are not opened
+    return next(lines)
+
+
+main = subcommands(upper=upper, chunks=chunks, first=first)
+
+
+if __name__ == '__main__':
+    main.execute()
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+
+'''
+$ stdin_invalid.py a b  # returncode=1 stderr=True
+Error: Stdin arg "lines" must be a positional argument, e.g. def func(lines)
+'''
+
+from hashbang import command, Argument
+
+
+@command
+def main(*lines: Argument(stdin=True)):
+    print(lines)
+
+
+if __name__ == '__main__':
+    main.execute()
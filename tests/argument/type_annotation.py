@@ -14,7 +14,7 @@ from hashbang import command, Argument
 @command
 def main(*, arg: str = 'one'):
     '''
-    Test to make sure that non-Argument annotations are ignored
+    Test to make sure that str annotations leave the value unchanged
     '''
     print('arg={}'.format(repr(arg)))
 
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+'''
+$ type_derived.py 3 a.txt b.txt a.txt
+count=3 paths=(PosixPath('a.txt'), PosixPath('b.txt'), PosixPath('a.txt'))
+same=True ratio=None color=None since=None
+
+$ type_derived.py 3 --ratio 0.5 --color green --since 2024-05-01T12:30
+count=3 paths=()
+same=False ratio=0.5 color=<Color.green: 2> since=datetime.datetime(2024, 5, 1, 12, 30)
+
+$ type_derived.py 3 --color 1
+count=3 paths=()
+same=False ratio=None color=<Color.red: 1> since=None
+
+$ type_derived.py three  # returncode=2 stderr=True glob=True
+...
+type_derived.py: error: argument count: invalid int value: 'three'
+
+$ type_derived.py 3 --color blue  # returncode=2 stderr=True glob=True
+...
+type_derived.py: error: argument --color: invalid choice: 'blue' (choose from 'red', 'green')
+'''
+
+import datetime
+import enum
+
+from hashbang import command
+from pathlib import Path
+from typing import Optional
+
+
+class Color(enum.Enum):
+    red = 1
+    green = 2
+
+
+@command
+def main(count: int,
+         *paths: Path,
+         ratio: Optional[float] = None,
+         color: Color = None,
+         since: datetime.datetime = None):
+    print('count={} paths={}'.format(*map(repr, (count, paths))))
+    # The converted paths are reused for repeated arguments
+    same = len(paths) > 2 and paths[0] is paths[2]
+    print('same={} ratio={} color={} since={}'.format(
+        *map(repr, (same, ratio, color, since))))
+
+
+if __name__ == '__main__':
+    main.execute()
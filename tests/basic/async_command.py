@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+'''
+$ async_command.py sleep 2  # minpython=3.7
+Slept 2 times
+
+$ async_command.py count 3  # minpython=3.7
+0
+1
+2
+
+$ async_command.py labelled 3  # minpython=3.7
+Processing 0
+Processing 1
+Processing 2
+
+$ async_command.py interrupt  # minpython=3.7 returncode=1
+Cleaned up
+
+$ async_command.py interrupt  # minpython=3.7 returncode=1 stderr=True
+^C
+
+$ async_command.py delegate echo a b  # minpython=3.7
+a b
+
+$ async_command.py delegate echo --help  # minpython=3.7
+> usage: async_command.py delegate echo [words ...]
+>
+> positional arguments:
+>   words
+'''
+
+import asyncio
+import os
+import signal
+
+from hashbang import command, subcommands, NoMatchingDelegate
+
+
+@command
+async def sleep(times):
+    for _ in range(int(times)):
+        await asyncio.sleep(0)
+    return 'Slept {} times'.format(times)
+
+
+@command
+async def count(limit):
+    for i in range(int(limit)):
+        await asyncio.sleep(0)
+        yield i
+
+
+@command(return_value_processor=lambda value: print('Processing', value))
+async def labelled(limit):
+    async for i in count(limit):
+        yield i
+
+
+@command
+async def interrupt():
+    try:
+        os.kill(os.getpid(), signal.SIGINT)
+        await asyncio.sleep(10)
+    finally:
+        print('Cleaned up')
+
+
+@command
+def echo(*words):
+    return ' '.join(words)
+
+
+@command.delegator
+async def delegate(subcommand, *_REMAINDER_):
+    await asyncio.sleep(0)
+    if subcommand == 'echo':
+        echo.execute(_REMAINDER_)
+    raise NoMatchingDelegate()
+
+
+main = subcommands(
+    sleep=sleep, count=count, labelled=labelled, interrupt=interrupt,
+    delegate=delegate)
+
+if __name__ == '__main__':
+    main.execute()
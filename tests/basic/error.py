@@ -7,7 +7,7 @@ Error: runtime error
 $ error.py --error=subprocess # returncode=1 stderr=True glob=True
 Error: Command 'exit 132' returned non-zero exit status 132*
 
-$ error.py --error=custom  # returncode=1 stderr=True glob=True
+$ error.py --error=custom  # returncode=1 stderr=True glob=True inprocess=False
 > Traceback (most recent call last):
 >   File "error.py", *
 >     main.execute()
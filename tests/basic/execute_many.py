@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+'''
+$ execute_many.py
+3
+2
+(3, 0)
+(2, 0)
+(None, 2)
+(RuntimeError('Failed'), 1)
+(None, 3)
+default_values={}
+
+$ execute_many.py --workers 3  # glob=True
+...
+(3, 0)
+(2, 0)
+(None, 2)
+(RuntimeError('Failed'), 1)
+(None, 3)
+default_values={}
+
+$ execute_many.py  # stderr=True
+usage: add [--sub SUB] [--fail] [--exit EXIT] [-h] a [b]
+add: error: unrecognized arguments: --invalid
+Error: Failed
+
+$ execute_many.py --delegated  # glob=True
+usage: add [--sub SUB] [--fail] [--exit EXIT] a [b]
+...
+(None, 0)
+3
+(None, 0)
+4
+(None, 0)
+default_values={}
+
+$ execute_many.py --threads
+2000 calls returned their own result
+'''
+
+import sys
+
+from hashbang import command, NoMatchingDelegate
+
+
+@command(prog='add')
+def add(a, b='0', *, sub='0', fail=False, exit=None):
+    if fail:
+        raise RuntimeError('Failed')
+    if exit is not None:
+        sys.exit(int(exit))
+    return int(a) + int(b) - int(sub)
+
+
+@command.delegator
+def calc(op, *_REMAINDER_, negate=False):
+    if op != 'add':
+        raise NoMatchingDelegate()
+    add.execute(_REMAINDER_, sub='1' if negate else '0')
+
+
+def run_threads():
+    # Switch threads as often as possible, so that threads setting up a
+    # shared parser would run into each other
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        return [mismatch for trial in range(200)
+                for mismatch in run_trial(trial)]
+    finally:
+        sys.setswitchinterval(interval)
+
+
+def run_trial(trial):
+    # A new command for each trial, whose parser is not set up yet
+    @command(return_value_processor=lambda value: None)
+    def double(value):
+        return int(value) * 2
+
+    argvs = [[str(trial * 10 + i)] for i in range(10)]
+    results = double.execute_many(argvs, workers=8)
+    return [(argv, result) for argv, result in zip(argvs, results)
+            if result != (int(argv[0]) * 2, 0)]
+
+
+@command
+def main(*, workers=None, delegated=False, threads=False):
+    if threads:
+        mismatches = run_threads()
+        if mismatches:
+            print(mismatches)
+        else:
+            print('2000 calls returned their own result')
+        return
+    if delegated:
+        # Neither the help mode nor the default values passed by the delegator
+        # carry over to the later executions
+        argvs = [['--help', 'add'], ['add', '1', '2'], ['--negate', 'add', '5']]
+        for result in calc.execute_many(argvs):
+            print(result)
+        print('default_values={}'.format(
+            add._hashbang_command.default_values))
+        return
+    argvs = [
+        ['1', '2'],
+        ['3', '--sub', '1'],
+        ['6', '--invalid'],
+        ['4', '--fail'],
+        ['5', '--exit', '3'],
+    ]
+    results = list(add.execute_many(
+        argvs, workers=int(workers) if workers else None))
+    for result in results:
+        print(result)
+    print('default_values={}'.format(add._hashbang_command.default_values))
+
+
+if __name__ == '__main__':
+    main.execute()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+'''
+$ generator.py 3
+0
+1
+2
+
+$ generator.py --squares 4
+0
+1
+4
+9
+
+$ generator.py --list 3
+[0, 1, 2]
+
+$ generator.py --forever | head -n 2
+0
+1
+
+$ generator.py --forever 2>&1 | head -n 2
+0
+1
+
+$ generator.py --zipped 2
+(0, 'a')
+(1, 'b')
+
+$ generator.py --closed_stdout 3
+Stopped after 1 items
+'''
+
+import io
+import itertools
+import sys
+
+from hashbang import command
+from hashbang.hashbang import _default_return_value_processor
+
+
+class ClosedStdout(io.StringIO):
+
+    def write(self, text):
+        raise BrokenPipeError()
+
+
+def write_to_closed_stdout(numbers):
+    '''
+    Writes to a replaced stdout without a file descriptor, whose reader went
+    away.
+    '''
+    produced = []
+
+    def generate():
+        for i in numbers:
+            produced.append(i)
+            yield i
+    stdout = sys.stdout
+    sys.stdout = ClosedStdout()
+    try:
+        _default_return_value_processor(generate())
+    finally:
+        sys.stdout = stdout
+    return 'Stopped after {} items'.format(len(produced))
+
+
+@command
+def main(count=None, *, squares=False, list_=False, forever=False,
+         zipped=False, closed_stdout=False):
+    numbers = itertools.count() if forever else range(int(count))
+    if list_:
+        return list(numbers)
+    if squares:
+        return (i * i for i in numbers)
+    if zipped:
+        # Other iterators are streamed like generators
+        return zip(numbers, 'abc')
+    if closed_stdout:
+        return write_to_closed_stdout(numbers)
+    return (i for i in numbers)
+
+
+if __name__ == '__main__':
+    main.execute()
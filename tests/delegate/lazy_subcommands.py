@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+'''
+$ lazy_subcommands.py --help  # inprocess=False
+> usage: lazy_subcommands.py {commit,branch,missing}
+>
+> positional arguments:
+>   {commit,branch,missing}
+
+$ lazy_subcommands.py commit -m "Initial commit"  # inprocess=False
+Importing lazy_subcommands
+commit message='Initial commit'
+
+$ lazy_subcommands.py branch  # inprocess=False
+Importing lazy_subcommands
+branch name=None
+
+$ lazy_subcommands.py missing  # returncode=1 stderr=True glob=True inprocess=False
+...ModuleNotFoundError: No module named 'nonexistent_module'
+
+$ lazy_subcommands.py <TAB>
+commit\x0bbranch\x0bmissing
+
+$ lazy_subcommands.py commit --m<TAB>
+--message 
+'''
+
+from hashbang import command, subcommands, Argument
+
+
+if __name__ != '__main__':
+    print('Importing', __name__)
+
+
+@command
+def commit(*, message: Argument(aliases=('m',)) = ''):
+    print('commit message={!r}'.format(message))
+
+
+@command
+def branch(name=None):
+    print('branch name={!r}'.format(name))
+
+
+main = subcommands(
+    commit='lazy_subcommands:commit',
+    branch='lazy_subcommands:branch',
+    missing='nonexistent_module:main')
+
+if __name__ == '__main__':
+    main.execute()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+'''
+$ nested_subcommands.py remote branch list origin
+Listing branches of origin
+
+$ nested_subcommands.py remote branch list --help
+> usage: nested_subcommands.py remote branch list remote
+>
+> positional arguments:
+>   remote
+
+$ nested_subcommands.py remote branch --help
+> usage: nested_subcommands.py remote branch {list}
+>
+> positional arguments:
+>   {list}
+
+$ nested_subcommands.py remote branch list -- --help
+Listing branches of --help
+
+$ nested_subcommands.py remote branch <TAB>
+list 
+
+$ nested_subcommands.py remote branch list <TAB>
+origin\x0bupstream
+
+$ nested_subcommands.py remote tag  # returncode=2 stderr=True glob=True
+...error: argument subcommand: invalid choice: 'tag' (choose from 'branch')
+'''
+
+from hashbang import command, subcommands, Argument
+
+
+@command
+def list_branches(
+        remote: Argument(completer=lambda **_: ('origin', 'upstream'))):
+    print('Listing branches of', remote)
+
+
+# Each level only looks up the next subcommand by name, without building its
+# parser
+main = subcommands(
+    remote=subcommands(branch=subcommands(list=list_branches)))
+
+
+if __name__ == '__main__':
+    main.execute()
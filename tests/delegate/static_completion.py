@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+'''
+$ static_completion.py build release
+build release jobs=1
+
+$ -m hashbang.completion_script generate static_completion.py --shell fish  # glob=True
+# fish completion for static_completion.py, generated by hashbang-completion
+...
+complete -c static_completion.py -n '__hashbang_static_completion_py_at :' -s h -l help -d 'show this help message and exit'
+complete -c static_completion.py -n '__hashbang_static_completion_py_at : 0' -f -a 'build' -d 'Build the project'
+complete -c static_completion.py -n '__hashbang_static_completion_py_at : 0' -f -a 'deploy' -d 'Deploy the project'
+complete -c static_completion.py -n '__hashbang_static_completion_py_at :build' -s h -l help -d 'show this help message and exit'
+complete -c static_completion.py -n '__hashbang_static_completion_py_at :build' -l jobs -s j -r -d 'Number of jobs'
+complete -c static_completion.py -n '__hashbang_static_completion_py_at :build 0' -f -a 'debug'
+complete -c static_completion.py -n '__hashbang_static_completion_py_at :build 0' -f -a 'release'
+complete -c static_completion.py -n '__hashbang_static_completion_py_at :deploy' -s h -l help -d 'show this help message and exit'
+complete -c static_completion.py -n '__hashbang_static_completion_py_at :deploy 0+' -f -a '(__hashbang_static_completion_py_python)'
+
+$ -m hashbang.completion_script generate static_completion.py --shell bash --prog build-tool  # glob=True
+# bash completion for build-tool, generated by hashbang-completion
+...
+complete -o default -F _hashbang_build_tool 'build-tool'
+
+$ -m hashbang.completion_script generate static_completion.py --shell tcsh  # returncode=2 stderr=True glob=True
+usage: * generate ...
+* generate: error: argument --shell: invalid choice: 'tcsh' (choose from *)
+'''
+
+from hashbang import command, subcommands, Argument
+
+
+@command
+def build(
+        target: Argument(choices=('debug', 'release')) = 'debug',
+        *,
+        jobs: Argument(aliases=('j',), help='Number of jobs') = '1'):
+    '''Build the project'''
+    print('build {} jobs={}'.format(target, jobs))
+
+
+@command
+def deploy(*hosts: Argument(completer=lambda **_: ('alpha', 'beta'))):
+    '''Deploy the project'''
+    print('deploy {}'.format(' '.join(hosts)))
+
+
+main = subcommands(build=build, deploy=deploy)
+
+if __name__ == '__main__':
+    main.execute()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+'''
+$ batch.py --hashbang-batch < batch.txt  # returncode=123
+hello alice!
+hello bob smith?
+hi carol!
+hello dave!
+hello erin!
+
+$ batch.py --hashbang-batch < batch.txt  # returncode=123 stderr=True
+dave --exit 2: exited with status 2
+
+$ batch.py --greeting hey --hashbang-batch=line < batch.txt  # returncode=123
+hey alice!
+hey bob smith?
+hi carol!
+hey dave!
+hey erin!
+
+$ batch.py --hashbang-batch --hashbang-batch-jobs 3 < batch.txt  # returncode=123 stderr=True
+dave --exit 2: exited with status 2
+
+$ batch.py --hashbang-batch=nul --greeting bye < batch.nul  # returncode=124
+bye x!
+bye y z!
+
+$ batch.py --hashbang-batch=nul < batch.nul  # returncode=124 stderr=True
+crash: exited with status 255
+
+$ batch.py frank
+hello frank!
+'''
+
+import sys
+
+from hashbang import command
+from hashbang.batch import Batch
+
+
+@command(Batch())
+def main(name, punctuation='!', *, greeting='hello', exit='0'):
+    if name == 'crash':
+        sys.exit(255)
+    print('{} {}{}'.format(greeting, name, punctuation))
+    sys.exit(int(exit))
+
+
+if __name__ == '__main__':
+    main.execute()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+'''
+Default values are read from layered config files in different formats, and
+converted through the type of each argument.
+
+$ config_layers.py grep
+file='notes.txt' after=3 before=5 color=True pattern=['TODO', 'FIXME']
+
+$ config_layers.py grep --after 7 --nocolor --pattern bug main.py
+file='main.py' after=7 before=5 color=False pattern=['BUG']
+
+$ config_layers.py count  # minpython=3.11
+max_count=10 pattern=['XXX']
+
+$ config_layers.py invalid  # returncode=1 stderr=True glob=True
+Error: Invalid boolean value 'maybe' for color in */config_layers/invalid.ini
+
+$ config_layers.py cached
+defaults.ini cached
+'''
+
+import os
+import tempfile
+
+from hashbang import command, subcommands, Argument, ConfigFile
+from hashbang import configfile
+from pathlib import Path
+
+DIR = Path(__file__).parent/'config_layers'
+
+os.environ['XDG_CACHE_HOME'] = os.path.join(
+    tempfile.gettempdir(), 'hashbang_config_layers_test')
+# The user layer of grep is config_layers/user/grep_layers.ini
+os.environ['XDG_CONFIG_HOME'] = str(DIR/'user')
+
+# Cache the small test files too
+configfile._CACHE_MIN_BYTES = 0
+
+
+@command(
+    ConfigFile(DIR/'defaults.ini', DIR/'project.json', name='grep_layers.ini'),
+    Argument('after', type=int),
+    Argument('before', type=int),
+    Argument('pattern', append=True, type=str.upper))
+def grep(file=None, *, after=0, before=0, color=True, pattern=()):
+    print('file={} after={} before={} color={} pattern={}'.format(
+        *map(repr, (file, after, before, color, pattern))))
+
+
+@command(
+    ConfigFile(DIR/'project.toml', section='tool.grep'),
+    Argument('max_count', type=int),
+    Argument('pattern', append=True, type=str.upper))
+def count(*, max_count=0, pattern=()):
+    print('max_count={} pattern={}'.format(*map(repr, (max_count, pattern))))
+
+
+@command(ConfigFile(DIR/'invalid.ini'))
+def invalid(*, color=False):
+    print('color={}'.format(color))
+
+
+@command
+def cached():
+    path = str(DIR/'defaults.ini')
+    stat = os.stat(path)
+    entry = configfile._DiskCache(
+        path, (stat.st_mtime_ns, stat.st_size)).load()
+    print('defaults.ini cached' if entry == configfile._parse(path)
+          else 'defaults.ini not cached')
+
+
+main = subcommands(grep=grep, count=count, invalid=invalid, cached=cached)
+
+
+if __name__ == '__main__':
+    main.execute()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+'''
+The first run starts the daemon, unless one was left running by a previous test
+run that did not finish. The last run stops it.
+
+$ daemon.py first  # glob=True inprocess=False
+hello first *
+
+$ daemon.py second  # inprocess=False
+hello second from the daemon
+
+$ daemon.py third --exit 3  # returncode=3 stderr=True inprocess=False
+exiting with 3
+
+$ daemon.py --stdin < fromfile.txt  # inprocess=False
+hello world from the daemon
+stdin: --arg2
+
+$ daemon.py --stop  # inprocess=False
+stopping the daemon
+'''
+
+import os
+import sys
+import tempfile
+
+# Keep the socket of the test daemon out of the user's runtime directory. This
+# must be set before hashbang is imported, which forwards to the daemon.
+os.environ['XDG_RUNTIME_DIR'] = os.path.join(
+    tempfile.gettempdir(), 'hashbang_daemon_test')
+os.makedirs(os.environ['XDG_RUNTIME_DIR'], mode=0o700, exist_ok=True)
+
+from hashbang import command
+from hashbang.daemon import Daemon
+import hashbang.daemon
+from hashbang._utils import daemon_socket
+
+
+@command(Daemon(idle_timeout=10))
+def main(name='world', *, exit='0', stdin=False, stop=False):
+    if stop:
+        # The daemon exits within a second once its socket is removed. If
+        # this did not run in the daemon, one was started before running it.
+        try:
+            os.unlink(daemon_socket(__file__))
+        except FileNotFoundError:
+            pass
+        print('stopping the daemon')
+        return
+    print('hello', name, 'from the daemon' if hashbang.daemon._worker
+          else 'directly')
+    if stdin:
+        print('stdin:', sys.stdin.readline().strip())
+    if exit != '0':
+        print('exiting with', exit, file=sys.stderr)
+        sys.exit(int(exit))
+
+
+if __name__ == '__main__':
+    main.execute()
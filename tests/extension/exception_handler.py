@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 
 '''
-$ exception_handler.py  # returncode=1 stderr=True glob=True
+$ exception_handler.py  # returncode=1 stderr=True glob=True inprocess=False
 > Traceback (most recent call last):
 >   File "exception_handler.py", line *, in <module>
 >     raiser.execute()
@@ -10,7 +10,7 @@ $ exception_handler.py  # returncode=1 stderr=True glob=True
 >     raise Exception('Raiser: Exception')
 > Exception: Raiser: Exception
 
-$ exception_handler.py --error=runtime  # returncode=1 stderr=True glob=True
+$ exception_handler.py --error=runtime  # returncode=1 stderr=True glob=True inprocess=False
 > Traceback (most recent call last):
 >   File "exception_handler.py", line *, in <module>
 >     raiser.execute()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+'''
+$ parallel.py copy dest a b c --jobs 4
+a -> dest
+b -> dest
+c -> dest
+
+$ parallel.py copy dest a b c --jobs 1
+a -> dest
+b -> dest
+c -> dest
+
+$ parallel.py copy dest 3 1 2 --jobs 4 --unordered
+1 -> dest
+2 -> dest
+3 -> dest
+
+$ parallel.py copy dest a fail b --jobs 4  # returncode=1
+a -> dest
+b -> dest
+
+$ parallel.py copy dest a fail b --jobs 4  # returncode=1 stderr=True
+Error: Cannot copy fail
+
+$ parallel.py copy dest a --upper
+A -> DEST
+
+$ parallel.py copy --help  # glob=True
+usage: parallel.py copy [--upper] [--jobs N] [--ordered] [--unordered]
+*[--fail-fast]
+*dest [files ...]
+...
+  --jobs N     *Number of calls to run at the same time (default: *)
+...
+
+$ parallel.py square 1 2 3 4 --jobs 2
+1
+4
+9
+16
+
+$ parallel.py total 1 2 3 --jobs 2
+Got 1, total 1
+Got 4, total 5
+Got 9, total 14
+
+$ parallel.py copy dest  # returncode=1 stderr=True
+Error: No values given for *files
+'''
+
+import time
+
+from hashbang import command, subcommands
+from hashbang.parallel import Parallel
+
+
+@command(Parallel())
+def copy(dest, *files, upper=False):
+    if files[0] == 'fail':
+        raise RuntimeError('Cannot copy fail')
+    if files[0].isdigit():
+        # Delay the result to test --unordered
+        time.sleep(int(files[0]) / 10)
+    result = '{} -> {}'.format(files[0], dest)
+    return result.upper() if upper else result
+
+
+@command(Parallel(processes=True))
+def square(*numbers):
+    return int(numbers[0]) ** 2
+
+
+class Total:
+    '''
+    A return value processor written for plain values, which sums them.
+    '''
+
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, value):
+        self.total += value
+        print('Got {}, total {}'.format(value, self.total))
+
+
+@command(Parallel(), return_value_processor=Total())
+def total(*numbers):
+    return int(numbers[0]) ** 2
+
+
+main = subcommands(copy=copy, square=square, total=total)
+
+if __name__ == '__main__':
+    main.execute()
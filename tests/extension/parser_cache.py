@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+'''
+$ parser_cache.py --new-cache-dir
+Using a new cache directory
+
+$ parser_cache.py --cache-entries
+0 cache entries
+
+$ parser_cache.py
+src=None dest='out' rest=() verbose=False level=1
+
+$ parser_cache.py --cache-entries
+1 cache entries
+
+$ parser_cache.py a -v --level 3
+src='a' dest='out' rest=() verbose=True level=3
+
+$ parser_cache.py a -v --level 3
+src='a' dest='out' rest=() verbose=True level=3
+
+$ parser_cache.py a b c d --noverbose
+src='a' dest='b' rest=('c', 'd') verbose=False level=1
+
+$ parser_cache.py --level 4 --level2  # returncode=2 stderr=True glob=True
+usage: parser_cache.py [--verbose] [--level {1,2,3,4}] [-h]
+                       [src] [dest] [rest *]
+parser_cache.py: error: unrecognized arguments: --level2
+
+$ parser_cache.py --help  # glob=True
+> usage: parser_cache.py [--verbose] [--level {1,2,3,4}] [-h]
+>                        [src] [dest] [rest *]
+>
+> Test that the parser rebuilt from the parser cache behaves the same as the one
+> created by inspecting the function. The first run populates the cache and the
+> subsequent runs read from it.
+>
+> positional arguments:
+>   src
+>   dest
+>   rest
+>
+> *:
+>   --verbose, -v
+>   --level {1,2,3,4}
+>   -h, --help         show this help message and exit
+'''
+
+import shutil
+import sys
+import tempfile
+
+from hashbang import command, Argument
+from pathlib import Path
+
+# The cache directory of the current test run is created by --new-cache-dir,
+# and its path is stored here for the other doctests
+CACHE_DIR_FILE = Path(tempfile.gettempdir())/'hashbang-test-parser-cache.txt'
+
+
+def new_cache_dir():
+    if CACHE_DIR_FILE.exists():
+        shutil.rmtree(CACHE_DIR_FILE.read_text(), ignore_errors=True)
+    CACHE_DIR_FILE.write_text(
+        tempfile.mkdtemp(prefix='hashbang-test-parser-cache-'))
+
+
+def cache_dir():
+    if not CACHE_DIR_FILE.exists():
+        new_cache_dir()
+    return Path(CACHE_DIR_FILE.read_text())
+
+
+@command(
+    Argument('level', choices=(1, 2, 3, 4), type=int),
+    Argument('verbose', aliases=('v',)),
+    parser_cache=cache_dir())
+def main(src=None, dest='out', *rest, verbose=False, level='1'):
+    '''
+    Test that the parser rebuilt from the parser cache behaves the same as the
+    one created by inspecting the function. The first run populates the cache
+    and the subsequent runs read from it.
+    '''
+    print('src={} dest={} rest={} verbose={} level={}'.format(
+        *[repr(i) for i in (src, dest, rest, verbose, level)]))
+
+
+if __name__ == '__main__':
+    # These are handled before the command, so that they are not part of the
+    # parser being tested
+    if sys.argv[1:] == ['--new-cache-dir']:
+        new_cache_dir()
+        print('Using a new cache directory')
+    elif sys.argv[1:] == ['--cache-entries']:
+        print('{} cache entries'.format(
+            len(list(cache_dir().glob('*.pickle')))))
+    else:
+        main.execute()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+'''
+The parser is built once and reused for later executions of the same command,
+unless the state it is built from changes.
+
+$ parser_reuse.py  # glob=True
+Building parser
+greeting='hello' name='alice' shout=False
+greeting='hello' name='bob' shout=True
+greeting='hello' name='carol' shout=False
+Building parser
+greeting='bonjour' name='dave' shout=False
+greeting='bonjour' name='eve' shout=False
+Building parser
+usage: parser_reuse.py [--greeting GREETING] [--shout] [-h] name
+...
+'''
+
+import sys
+
+from hashbang import command, Argument
+
+
+class CountBuilds:
+
+    def apply_hashbang_extension(self, cmd):
+        print('Building parser')
+
+
+@command(CountBuilds(), prog='parser_reuse.py')
+def greet(name, *, greeting='hello', shout=False):
+    print('greeting={!r} name={!r} shout={!r}'.format(greeting, name, shout))
+
+
+def run(argv, **kwargs):
+    try:
+        greet.execute(argv, **kwargs)
+    except SystemExit:
+        pass
+
+
+if __name__ == '__main__':
+    run(['alice'])
+    run(['bob', '--shout'])
+    run(['carol'])
+    # Changing the default values rebuilds the parser
+    run(['dave'], greeting='bonjour')
+    run(['eve'], greeting='bonjour')
+    # So does changing the argparse kwargs
+    greet._hashbang_command.argparse_kwargs['allow_abbrev'] = False
+    run(['--help'])
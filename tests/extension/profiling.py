@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+'''
+$ profiling.py compute 200 --hashbang-profile=profile_test.prof
+2646700
+
+$ profiling.py report profile_test.prof
+compute
+square
+
+$ profiling.py --hashbang-profile=profile_test.prof compute 200
+2646700
+
+$ profiling.py report profile_test.prof
+compute
+square
+
+$ profiling.py compute 200000 --hashbang-profile=profile_test.folded
+2666646666700000
+
+$ profiling.py report profile_test.folded
+compute
+'''
+
+import os
+
+from hashbang import command, subcommands
+
+
+def square(i):
+    return i * i
+
+
+@command
+def compute(n):
+    return sum(square(i) for i in range(int(n)))
+
+
+@command
+def report(path):
+    '''
+    Prints the functions defined in this file found in the profile, which
+    should not include the delegator, and deletes the profile.
+    '''
+    if path.endswith('.folded'):
+        # The samples are not deterministic, but compute should be in the
+        # stack of most of them
+        with open(path) as f:
+            names = {frame.split(' ')[0]
+                     for line in f
+                     for frame in line.rsplit(' ', 1)[0].split(';')
+                     if __file__ in frame}
+        names.discard('<module>')
+        names.discard('<genexpr>')
+        names.discard('square')
+    else:
+        import pstats
+        names = {name for filename, _, name in pstats.Stats(path).stats
+                 if filename == __file__ and name != '<genexpr>'}
+    os.unlink(path)
+    for name in sorted(names):
+        print(name)
+
+
+main = subcommands(compute=compute, report=report)
+
+
+if __name__ == '__main__':
+    main.execute()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+'''
+$ timings.py reset  # inprocess=False
+Cleared
+
+$ timings.py greet world  # inprocess=False
+Hello world
+
+$ timings.py show  # inprocess=False
+import
+signature greet
+signature nap
+signature show
+signature reset
+signature _run
+execute _run
+  call _run subcommand=greet
+    execute greet
+      create_parser greet delegation=False
+        extensions greet
+        argparse_init greet
+        add_arguments greet
+      parse greet
+      call greet
+    return_value greet
+
+$ timings.py nap  # inprocess=False minpython=3.7
+Slept
+
+$ timings.py show nap  # inprocess=False minpython=3.7
+import
+signature greet
+signature nap
+signature show
+signature reset
+signature _run
+execute _run
+  call _run subcommand=nap
+    execute nap
+      create_parser nap delegation=False
+        extensions nap
+        argparse_init nap
+        add_arguments nap
+      parse nap
+      call nap
+    await nap
+    return_value nap
+'''
+
+import asyncio
+import json
+import os
+import tempfile
+
+TIMINGS = os.path.join(tempfile.gettempdir(), 'hashbang_timings_test.jsonl')
+os.environ['HASHBANG_TIMINGS'] = TIMINGS
+
+from hashbang import command, subcommands
+
+
+@command
+def greet(name):
+    print('Hello', name)
+
+
+@command
+async def nap():
+    await asyncio.sleep(0)
+    return 'Slept'
+
+
+@command
+def show(name='greet'):
+    # Shows the phases of the last run of the command, without the timings,
+    # which vary between runs
+    with open(TIMINGS) as f:
+        run = [run for run in map(json.loads, f)
+               if run['argv'][1:2] == [name]][-1]
+    for phase in run['phases']:
+        print('{}{}{}{}'.format(
+            '  ' * phase['depth'],
+            phase['phase'],
+            ' ' + phase['command'] if phase['command'] else '',
+            ''.join(' {}={}'.format(key, phase[key]) for key in
+                    sorted(set(phase) - {'phase', 'command', 'depth',
+                                         'start_ms', 'duration_ms'}))))
+
+
+@command
+def reset():
+    if os.path.exists(TIMINGS):
+        os.unlink(TIMINGS)
+    print('Cleared')
+
+
+main = subcommands(greet=greet, nap=nap, show=show, reset=reset)
+
+
+if __name__ == '__main__':
+    main.execute()
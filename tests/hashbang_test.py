@@ -1,11 +1,17 @@
 import ast
+import hashlib
+import io
+import json
 import unittest
 import os
+import shlex
 import subprocess
 from subprocess import CalledProcessError
 import sys
 import re
 import textwrap
+import traceback
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from importlib.machinery import SourceFileLoader
 from importlib import util as importutil
@@ -30,42 +36,331 @@ TEST_FILES = [file for glob in TEST_GLOBS for file in list(glob)]
 DOC_MATCH = r'^\$ ?(.*[\w\W]*?)(?:^$|\Z)'
 SET_MATCH = r'\{\{(.*)\}\}'
 
+# Modules that should only be imported when a run actually needs them. This is
+# checked instead of the import time, which depends on the machine.
+LAZY_IMPORTS = ('argcomplete', 'asyncio', 'pathlib', 'pickle', 'subprocess',
+                'traceback')
+
+
+# Number of worker processes the doctests are sharded across, one test file
+# per task (the doctests in a file run in order, since some depend on the state
+# left by the previous ones). Defaults to the number of CPUs.
+JOBS_ENV = 'HASHBANG_TEST_JOBS'
+# When set to 1, each worker imports the test scripts once and calls
+# `execute(args)` on their commands, instead of starting a new interpreter for
+# each doctest. Doctests which need a shell (e.g. pipes or environment
+# variables), completion tests, and doctests with `# inprocess=False` still run
+# in a subprocess.
+INPROCESS_ENV = 'HASHBANG_TEST_INPROCESS'
+# Commands containing any of these characters are run by the shell
+SHELL_CHARACTERS = frozenset('|&;<>()$`\\*?[]{}~')
+# When HASHBANG_TEST_CACHE=1 is set, or --cache is passed when running this
+# file directly, the doctests which passed are recorded here, and are skipped
+# by later runs until the files in the directory of the test, the hashbang
+# sources, this file, the Python interpreter or the argcomplete version
+# changes. This is off by default, including in CI, since the environment of
+# the doctests is not part of the key.
+CACHE_FILE = TEST_DIR/'.doctest_cache.json'
+CACHE_ENV = 'HASHBANG_TEST_CACHE'
+
+
+def _popen(command, *, cwd, pythonpath):
+    return subprocess.Popen(
+            sys.executable + ' ' + command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env={'PYTHONPATH': pythonpath},
+            cwd=cwd,
+            shell=True,
+            universal_newlines=True)
+
+
+def _popen_completion(command, *, cwd, pythonpath):
+    cmd = sys.executable + ' ' + command.strip().split(' ')[0]
+    return subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env={
+                'PYTHONPATH': pythonpath,
+                '_ARC_DEBUG': '1',
+                '_ARGCOMPLETE': '1',
+                '_COMPLETE_TO_STDOUT': '1',
+                'COMP_LINE': command,
+                'COMP_POINT': str(len(command)),
+            },
+            cwd=cwd,
+            shell=True,
+            universal_newlines=True)
+
+
+def _run_subprocess(doctest, *, cwd, pythonpath):
+    if doctest.get_config('completion', False):
+        p = _popen_completion(doctest.command, cwd=cwd, pythonpath=pythonpath)
+    else:
+        p = _popen(doctest.command, cwd=cwd, pythonpath=pythonpath)
+    stdout, stderr = p.communicate()
+    return p.returncode, stdout, stderr
+
+
+class InProcessRunner:
+    '''
+    Runs the doctests of test scripts in the current process. Each script is
+    imported once (not as `__main__`), and the command executed in its
+    `if __name__ == '__main__':` block is called with `execute(args)`, with
+    stdin empty, stdout and stderr captured, and `SystemExit` turned into the
+    return code.
+    '''
+
+    def __init__(self):
+        self._main_commands = {}
+        self._modules = {}
+
+    def run(self, doctest, cwd):
+        '''
+        Returns `(returncode, stdout, stderr)`, or `None` if the doctest cannot
+        run in process.
+        '''
+        if (doctest.get_config('completion', False) or
+                not doctest.get_config('inprocess', True) or
+                SHELL_CHARACTERS.intersection(doctest.command)):
+            return None
+        args = shlex.split(doctest.command)
+        if not args or not args[0].endswith('.py'):
+            return None
+        path = Path(cwd)/args[0]
+        if path not in self._main_commands:
+            self._main_commands[path] = self._main_command(path)
+        main_command = self._main_commands[path]
+        if main_command is None:
+            return None
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        saved = sys.argv, sys.stdin, sys.stdout, sys.stderr
+        sys.argv = list(args)
+        sys.stdin, sys.stdout, sys.stderr = io.StringIO(), stdout, stderr
+        returncode = 0
+        try:
+            module = self._modules.get(path)
+            if module is None:
+                module = self._modules[path] = self._import(path)
+            eval(main_command, vars(module)).execute(args[1:])
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                returncode = e.code or 0
+            else:
+                print(e.code, file=sys.stderr)
+                returncode = 1
+        except BaseException:
+            traceback.print_exc()
+            returncode = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            sys.argv, sys.stdin, sys.stdout, sys.stderr = saved
+        return returncode, stdout.getvalue(), stderr.getvalue()
+
+    @staticmethod
+    def _main_command(path):
+        '''
+        Returns the compiled expression `X` if the `__main__` block of the
+        script at `path` is exactly `X.execute()`, or `None` otherwise.
+        '''
+        tree = ast.parse(path.read_text(), str(path))
+        for node in tree.body:
+            if not (isinstance(node, ast.If) and
+                    isinstance(node.test, ast.Compare) and
+                    isinstance(node.test.left, ast.Name) and
+                    node.test.left.id == '__name__' and
+                    isinstance(node.test.ops[0], ast.Eq)):
+                continue
+            body = node.body
+            if (len(body) == 1 and isinstance(body[0], ast.Expr) and
+                    isinstance(body[0].value, ast.Call) and
+                    isinstance(body[0].value.func, ast.Attribute) and
+                    body[0].value.func.attr == 'execute' and
+                    not body[0].value.args and
+                    not body[0].value.keywords):
+                expression = ast.Expression(body[0].value.func.value)
+                return compile(expression, str(path), 'eval')
+            return None
+        return None
+
+    @staticmethod
+    def _import(path):
+        name = 'hashbang_test_{}_{}'.format(path.parent.name, path.stem)
+        spec = importutil.spec_from_loader(
+            name, SourceFileLoader(name, str(path)))
+        module = importutil.module_from_spec(spec)
+        sys.modules[name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[name]
+            raise
+        return module
+
+
+# The in-process runner of the worker, created by `_init_worker`
+_runner = None
+
+
+class DocTestCache:
+    '''
+    The set of doctests which passed, keyed by a hash of the doctest, the
+    files in the directory of its test file (which include the fixtures and
+    helper modules the test reads), and everything else the result depends
+    on.
+    '''
+
+    def __init__(self, path, pythonpath):
+        self.path = path
+        self._environment = self._hash_environment(pythonpath)
+        self._dir_keys = {}
+        try:
+            with path.open('r') as f:
+                self._passed = set(json.load(f)['passed'])
+        except (OSError, ValueError, KeyError):
+            self._passed = set()
+        self._seen = set()
+        self._ran = set()
+        self._newly_passed = set()
+
+    @staticmethod
+    def _hash_environment(pythonpath):
+        digest = hashlib.sha1()
+        sources = sorted((Path(pythonpath)/'hashbang').glob('*.py'))
+        for source in sources + [Path(__file__)]:
+            digest.update(source.name.encode())
+            digest.update(source.read_bytes())
+        digest.update(sys.executable.encode())
+        digest.update(sys.version.encode())
+        digest.update(repr(_argcomplete_version()).encode())
+        return digest.hexdigest()
+
+    def _hash_directory(self, directory):
+        if directory not in self._dir_keys:
+            digest = hashlib.sha1(self._environment.encode())
+            for file in sorted(directory.rglob('*')):
+                if (not file.is_file() or file == self.path or
+                        '__pycache__' in file.parts):
+                    continue
+                digest.update(
+                    str(file.relative_to(directory)).encode() + b'\0')
+                digest.update(file.read_bytes())
+            self._dir_keys[directory] = digest.hexdigest()
+        return self._dir_keys[directory]
+
+    def key(self, doctest):
+        testfile = Path(doctest.testfile)
+        digest = hashlib.sha1(self._hash_directory(testfile.parent).encode())
+        digest.update(testfile.name.encode())
+        digest.update(json.dumps(
+            [doctest.command, doctest.expected, doctest.configs],
+            sort_keys=True).encode())
+        key = digest.hexdigest()
+        self._seen.add(key)
+        return key
+
+    def all_passed(self, doctests):
+        '''
+        Whether all of `doctests` passed in a previous run. The doctests of a
+        file are only skipped together, since they can depend on the state
+        left by the previous ones.
+        '''
+        return all(self.key(doctest) in self._passed for doctest in doctests)
+
+    def record(self, doctest, passed):
+        key = self.key(doctest)
+        self._ran.add(key)
+        if passed:
+            self._newly_passed.add(key)
+
+    def save(self):
+        passed = ((self._passed & self._seen) - self._ran) | self._newly_passed
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with tmp.open('w') as f:
+            json.dump({'passed': sorted(passed)}, f, indent=0)
+        os.replace(str(tmp), str(self.path))
+
+
+def _argcomplete_version():
+    try:
+        from importlib import metadata
+        return metadata.version('argcomplete')
+    except ImportError:
+        # Not installed, or Python < 3.8
+        return None
 
-class Test(unittest.TestCase):
 
-    def _Popen(self, command, *, cwd):
-        return subprocess.Popen(
-                sys.executable + ' ' + command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                env={'PYTHONPATH': str(Path.cwd())},
-                cwd=cwd,
-                shell=True,
-                universal_newlines=True)
-
-    def _test_completion(self, command, *, cwd):
-        cmd = sys.executable + ' ' + command.strip().split(' ')[0]
-        return subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                env={
-                    'PYTHONPATH': str(Path.cwd()),
-                    '_ARC_DEBUG': '1',
-                    '_ARGCOMPLETE': '1',
-                    '_COMPLETE_TO_STDOUT': '1',
-                    'COMP_LINE': command,
-                    'COMP_POINT': str(len(command)),
-                },
-                cwd=cwd,
-                shell=True,
-                universal_newlines=True)
+def _cache_enabled():
+    return os.environ.get(CACHE_ENV, '0') not in ('', '0')
+
+
+def _init_worker(pythonpath, inprocess):
+    global _runner
+    # Match the environment of the subprocesses
+    os.environ.clear()
+    os.environ['PYTHONPATH'] = pythonpath
+    if pythonpath not in sys.path:
+        sys.path.insert(0, pythonpath)
+    if inprocess:
+        _runner = InProcessRunner()
+
+
+def _run_file(testfile, doctests, pythonpath):
+    '''
+    Runs `doctests` from `testfile` in order, returning a list of
+    `(returncode, stdout, stderr)` for each of them.
+    '''
+    cwd = str(testfile.parent)
+    if _runner is not None:
+        os.chdir(cwd)
+    results = []
+    for doctest in doctests:
+        result = _runner.run(doctest, cwd) if _runner is not None else None
+        if result is None:
+            result = _run_subprocess(doctest, cwd=cwd, pythonpath=pythonpath)
+        results.append(result)
+    return results
+
+
+def run_test_files(plans, pythonpath):
+    '''
+    Runs the `(testfile, doctests)` in `plans`, sharded across a pool of
+    `HASHBANG_TEST_JOBS` processes, and yields the results of each file in
+    order.
+    '''
+    jobs = int(os.environ.get(JOBS_ENV) or os.cpu_count() or 1)
+    inprocess = os.environ.get(INPROCESS_ENV, '0') not in ('', '0')
+    if jobs == 1 and not inprocess:
+        for testfile, doctests in plans:
+            yield _run_file(testfile, doctests, pythonpath)
+        return
+    with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_worker,
+            initargs=(pythonpath, inprocess)) as executor:
+        futures = [
+            executor.submit(_run_file, testfile, doctests, pythonpath)
+            for testfile, doctests in plans]
+        for future in futures:
+            yield future.result()
+
+
+class Test(unittest.TestCase):
 
     def is_argcomplete_available(self):
         return importutil.find_spec('argcomplete') is not None
 
     def test(self):
+        pythonpath = str(Path.cwd())
+        cache = None
+        if _cache_enabled():
+            cache = DocTestCache(CACHE_FILE, pythonpath)
+        plans = []
         for t in TEST_FILES:
+            doctests = []
             with t.open('r') as f:
                 for doctest in DocTest.fromfile(f):
                     if doctest.get_config('completion', False):
@@ -79,22 +374,34 @@ class Test(unittest.TestCase):
                         print('Skipping test because minpythonversion not met',
                               file=sys.stderr)
                         continue
+                    doctests.append(doctest)
+            if doctests and cache is not None and cache.all_passed(doctests):
+                print('Skipping {} doctests which passed before in {}'
+                      .format(len(doctests), t), file=sys.stderr)
+                continue
+            plans.append((t, doctests))
 
+        try:
+            results = run_test_files(plans, pythonpath)
+            for (t, doctests), file_results in zip(plans, results):
+                for doctest, (returncode, stdout, stderr) in zip(
+                        doctests, file_results):
+                    passed = False
                     with self.subTest(
                                 testfile=doctest.testfile,
                                 command=doctest.command):
                         print(doctest.describe())
-                        if doctest.get_config('completion', False):
-                            p = self._test_completion(
-                                    doctest.command, cwd=str(t.parent))
-                        else:
-                            p = self._Popen(doctest.command, cwd=str(t.parent))
-                        stdout, stderr = p.communicate()
                         self.assertEqual(
-                            p.returncode,
+                            returncode,
                             doctest.get_config('returncode', 0),
                             msg=stderr)
                         doctest.make_assertion(self, stdout, stderr)
+                        passed = True
+                    if cache is not None:
+                        cache.record(doctest, passed)
+        finally:
+            if cache is not None:
+                cache.save()
 
     def test_decorator(self):
         noarg = SourceFileLoader(
@@ -103,6 +410,17 @@ class Test(unittest.TestCase):
         self.assertEqual(noarg.main.__name__, 'main')
         self.assertEqual(noarg.main.__doc__, 'Function with no arguments')
 
+    def test_lazy_imports(self):
+        output = subprocess.check_output(
+            [sys.executable, '-c',
+             'import sys, hashbang; print(*sorted(sys.modules))'],
+            env={'PYTHONPATH': str(Path.cwd())},
+            universal_newlines=True)
+        loaded = set(output.split())
+        for module in LAZY_IMPORTS:
+            self.assertFalse(module in loaded,
+                             msg='{} imported eagerly'.format(module))
+
     def test_callable(self):
         callabletest = SourceFileLoader(
             'module.name',
@@ -177,8 +495,14 @@ class DocTest:
                   match any single character, '*' will match any number of
                   characters except newlines, and '...' will match any number
                   of characters including newlines.
+        4. inprocess - whether the command can be run in the test process
+                       when HASHBANG_TEST_INPROCESS is set. The default is
+                       True.
         '''
-        return type(default)(self.configs.get(key, default))
+        value = self.configs.get(key, default)
+        if isinstance(default, bool) and isinstance(value, str):
+            return value.lower() in ('true', '1')
+        return type(default)(value)
 
     def make_assertion(self, testcase, stdout, stderr):
         actual = stderr if self.get_config('stderr', False) else stdout
@@ -213,4 +537,7 @@ class DocTest:
 
 
 if __name__ == '__main__':
+    if '--cache' in sys.argv:
+        sys.argv.remove('--cache')
+        os.environ[CACHE_ENV] = '1'
     unittest.main()